@@ -0,0 +1,47 @@
+import argparse
+import subprocess
+import sys
+import time
+
+IMPORT_SCRIPT = 'import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)'
+
+
+def measure_import(module, repeats):
+    """Returns the best process wall time and import time of a module, each run in a fresh interpreter"""
+    wall_times = []
+    import_times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_SCRIPT.format(module=module)],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+        wall_times.append(time.perf_counter() - start)
+        import_times.append(float(output.strip().splitlines()[-1]))
+    return min(wall_times), min(import_times)
+
+
+def measure_startup(modules, repeats):
+    print('{0:<12} {1:>12} {2:>12}'.format('Module', 'Process (s)', 'Import (s)'))
+    for module in modules:
+        try:
+            wall_time, import_time = measure_import(module, repeats)
+        except subprocess.CalledProcessError:
+            print('{0:<12} {1:>12}'.format(module, 'failed'))
+            continue
+        print('{0:<12} {1:>12.3f} {2:>12.3f}'.format(module, wall_time, import_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure startup time of the net modules')
+    parser.add_argument('modules', nargs='*', default=['cases', 'plotter', 'predictor', 'net'],
+                        help='Modules to import')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of fresh interpreters per module')
+    args = parser.parse_args()
+    measure_startup(args.modules, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+CACHE_DIRECTORY = 'data/cache'
+
+
+def get_file_hash(filename):
+    file_hash = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def save_array(filename, array):
+    # Write to a temporary file first, so an interrupted run never leaves a broken cache entry. The name is
+    # unique per writer, so processes filling the same entry at once (e.g. sweep trials) never share it
+    if os.path.exists(filename):
+        return
+    file_descriptor, temporary_filename = tempfile.mkstemp(
+        dir=os.path.dirname(filename) or '.',
+        prefix=os.path.basename(filename) + '.',
+        suffix='.tmp',
+    )
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            np.save(file, array)
+        os.replace(temporary_filename, filename)
+    except Exception:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+        if not os.path.exists(filename):
+            raise
+
+
+def cached_arrays(filename, loader, **options):
+    """Returns the (inputs, targets) arrays of loader(filename, **options).
+
+    The arrays are stored as .npy files keyed by the contents of the source file, the loader and
+    its options. Later runs memory-map the stored arrays instead of parsing the source file again.
+    """
+    key = json.dumps({
+        'file': get_file_hash(filename),
+        'loader': loader.__name__,
+        'options': options,
+    }, sort_keys=True)
+    key_hash = hashlib.sha1(key.encode()).hexdigest()[:16]
+    base_filename = os.path.join(CACHE_DIRECTORY, '{}-{}'.format(os.path.basename(filename), key_hash))
+    inputs_filename = base_filename + '-inputs.npy'
+    targets_filename = base_filename + '-targets.npy'
+
+    if os.path.exists(inputs_filename) and os.path.exists(targets_filename):
+        return np.load(inputs_filename, mmap_mode='r'), np.load(targets_filename, mmap_mode='r')
+
+    inputs, targets = loader(filename, **options)
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    save_array(inputs_filename, inputs)
+    save_array(targets_filename, targets)
+    return inputs, targets
@@ -1,200 +1,459 @@
+import glob
+import itertools
+import os
+import queue
+import threading
 import numpy as np
 import random
+import cache
 import tflowtools as tft
 
+DATA_SOURCES = {}
 
-def bit_counter():
-    number_of_cases = 500
+
+class DataSource:
+    """A named loader of (inputs, targets) with what is known about its data before loading it.
+
+    The sizes and row count are None when they depend on the data on disk. Cached sources keep
+    parsed arrays in cache_directory. Streaming sources are called with the number of cases to
+    generate and can produce any number of fresh cases.
+    """
+
+    def __init__(self, name, loader, input_size=None, output_size=None, rows=None, cache_directory=None,
+                 streaming=False):
+        self.name = name
+        self.loader = loader
+        self.input_size = input_size
+        self.output_size = output_size
+        self.rows = rows
+        self.cache_directory = cache_directory
+        self.streaming = streaming
+
+    @property
+    def has_sizes(self):
+        return self.input_size is not None and self.output_size is not None
+
+    def get_memory_size(self, dtype=np.float64):
+        """Bytes taken by all inputs and targets as arrays of dtype, or None if the row count is unknown"""
+        if self.rows is None or not self.has_sizes:
+            return None
+        return self.rows * (self.input_size + self.output_size) * np.dtype(dtype).itemsize
+
+    def load(self, dtype=np.float64):
+        inputs, targets = to_arrays(self.loader(), dtype=dtype)
+        if self.has_sizes and (inputs.shape[1], targets.shape[1]) != (self.input_size, self.output_size):
+            raise ValueError('Data source "{}" loaded sizes {} -> {}, but declares {} -> {}'.format(
+                self.name, inputs.shape[1], targets.shape[1], self.input_size, self.output_size,
+            ))
+        return inputs, targets
+
+    def generate(self, number_of_cases):
+        return self.loader(number_of_cases)
+
+
+def register_data_source(name, **metadata):
+    """Decorator registering a loader as the data source name, see DataSource for the metadata"""
+    def register(loader):
+        DATA_SOURCES[name] = DataSource(name, loader, **metadata)
+        return loader
+    return register
+
+
+def get_data_source(name):
+    if name not in DATA_SOURCES:
+        raise ValueError('Unknown data source: "{}"'.format(name))
+    return DATA_SOURCES[name]
+
+
+@register_data_source('bit_counter', input_size=15, output_size=16, rows=500, streaming=True)
+def bit_counter(number_of_cases=500):
     number_of_bits = 15
-    return tft.gen_vector_count_cases(number_of_cases, number_of_bits)
+    return tft.gen_vector_count_arrays(number_of_cases, number_of_bits)
 
 
-def segment_counter():
+@register_data_source('segment_counter', input_size=25, output_size=9, rows=1000, streaming=True)
+def segment_counter(number_of_cases=1000):
     number_of_bits = 25
-    number_of_cases = 1000
     min_segments = 0
     max_segments = 8
-    return tft.gen_segmented_vector_cases(number_of_bits, number_of_cases, min_segments, max_segments)
+    return tft.gen_segmented_vector_arrays(number_of_bits, number_of_cases, min_segments, max_segments)
 
 
+@register_data_source('autoencoder_one_hot', input_size=8, output_size=8, rows=8)
 def autoencoder_one_hot():
     number_of_bits = 8
     return tft.gen_all_one_hot_cases(number_of_bits)
 
 
-def autoencoder_dense():
+@register_data_source('autoencoder_dense', input_size=8, output_size=8, rows=200, streaming=True)
+def autoencoder_dense(number_of_cases=200):
     number_of_bits = 8
-    number_of_cases = 200
     lower_density = 0.0
     upper_density = 1.0
-    return tft.gen_dense_autoencoder_cases(number_of_cases, number_of_bits, (lower_density, upper_density))
+    return tft.gen_dense_autoencoder_arrays(number_of_cases, number_of_bits, (lower_density, upper_density))
 
 
-def symmetry():
+@register_data_source('symmetry', input_size=100, output_size=2, rows=2000, streaming=True)
+def symmetry(number_of_cases=2000):
     number_of_bits = 100
-    number_of_cases = 2000
-    vectors = tft.gen_symvect_dataset(number_of_bits, number_of_cases)
-
-    return [(x[:-1], [1, 0]) if x[number_of_bits] == 0 else (x[:-1], [0, 1]) for x in vectors]
+    return tft.gen_symvect_dataset_arrays(number_of_bits, number_of_cases)
 
 
+@register_data_source('parity', input_size=10, output_size=2, rows=1024)
 def parity():
     number_of_bits = 10
     return tft.gen_all_parity_cases(number_of_bits)
 
 
-def mnist():
-    print('Loading mnist dataset...')
-    with open('data/mnist/all_flat_mnist_training_cases_text.txt') as file:
-        raw_data = [[int(x) for x in line.rstrip().split(' ')] for line in file.readlines()]
+
+def read_chunks(file, separator, chunk_size=100000):
+    """Parses the remaining lines of a file into arrays of at most chunk_size rows"""
+    while True:
+        lines = list(itertools.islice(file, chunk_size))
+        if not lines:
+            return
+        yield np.loadtxt(lines, delimiter=separator, ndmin=2)
+
+
+def parse_mnist(filename):
+    with open(filename) as file:
+        labels = np.array(file.readline().split(), dtype=int)
+        inputs = np.concatenate(list(read_chunks(file, separator=' ')))
 
     print('Processing cases')
-    cases = []
-    for index, case in enumerate(raw_data[1:]):
-        label = [0]*10
-        label[raw_data[0][index]] = 1
-        cases.append((case, label))
+    targets = np.zeros((len(inputs), 10))
+    targets[np.arange(len(inputs)), labels[:len(inputs)]] = 1
+    return inputs, targets
 
-    return cases
 
+@register_data_source('mnist', input_size=784, output_size=10, cache_directory=cache.CACHE_DIRECTORY)
+def mnist():
+    print('Loading mnist dataset...')
+    return cache.cached_arrays('data/mnist/all_flat_mnist_training_cases_text.txt', parse_mnist)
 
-def load_file(filename, separator, normalize=True):
-    with open(filename) as file:
-        raw_data = [[float(x) for x in line.rstrip().split(separator)] for line in file.readlines()]
-
-    cases = []
-    labels = []
-    max_label = max(int(case[-1]) for case in raw_data) + 1
-    for case in raw_data:
-        label = int(case[-1])
-        label_array = [0]*max_label
-        label_array[label - 1] = 1
-        labels.append(label_array)
-        cases.append(case[:len(case) - 1])
 
+def parse_file(filename, separator, normalize=True, chunk_size=100000):
+    # Running feature mean and sum of squared deviations, merged chunk by chunk (Chan et al.)
+    count = 0
+    means = 0.0
+    squared_deviations = 0.0
+    feature_chunks = []
+    label_chunks = []
+    with open(filename) as file:
+        for chunk in read_chunks(file, separator, chunk_size):
+            features = chunk[:, :-1]
+            feature_chunks.append(features)
+            label_chunks.append(chunk[:, -1].astype(int))
+
+            chunk_count = len(features)
+            chunk_means = features.mean(axis=0)
+            delta = chunk_means - means
+            total = count + chunk_count
+            means = means + delta * chunk_count / total
+            squared_deviations = (squared_deviations + ((features - chunk_means) ** 2).sum(axis=0)
+                                  + delta ** 2 * count * chunk_count / total)
+            count = total
+
+    inputs = np.concatenate(feature_chunks)
+    labels = np.concatenate(label_chunks)
     if normalize:
-        features = np.array(cases).transpose()
-        means = np.mean(features, axis=1)
-        standard_deviations = np.std(features, axis=1)
-        for i, row in enumerate(cases):
-            for j, col in enumerate(cases[i]):
-                cases[i][j] = (cases[i][j] - means[j]) / standard_deviations[j]
+        inputs -= means
+        inputs /= np.sqrt(squared_deviations / count)
+
+    # Labels are one-based, label n is set at index n - 1 of a vector of size max label + 1
+    targets = np.zeros((len(labels), labels.max() + 1))
+    targets[np.arange(len(labels)), labels - 1] = 1
+    return inputs, targets
 
-    data_set = [(case, labels[i]) for i, case in enumerate(cases)]
-    return data_set
+
+def load_file(filename, separator, normalize=True):
+    return cache.cached_arrays(filename, parse_file, separator=separator, normalize=normalize)
 
 
+@register_data_source('wine', input_size=11, output_size=9, rows=1599, cache_directory=cache.CACHE_DIRECTORY)
 def wine():
     print('Loading wine dataset...')
     return load_file(filename='data/wine.txt', separator=';', normalize=True)
 
 
+@register_data_source('glass', input_size=9, output_size=8, rows=214, cache_directory=cache.CACHE_DIRECTORY)
 def glass():
     print('Loading glass dataset...')
     return load_file(filename='data/glass.txt', separator=',', normalize=True)
 
 
+@register_data_source('yeast', input_size=8, output_size=11, rows=1484, cache_directory=cache.CACHE_DIRECTORY)
 def yeast():
     print('Loading yeast dataset...')
     return load_file(filename='data/yeast.txt', separator=',', normalize=True)
 
 
+@register_data_source('poker', input_size=10, output_size=10, rows=25010, cache_directory=cache.CACHE_DIRECTORY)
 def poker():
     print('Loading poker dataset...')
     return load_file(filename='data/poker/poker-hand-training-true.data', separator=',', normalize=True)
 
 
+@register_data_source('iris', input_size=4, output_size=3, rows=150, cache_directory=cache.CACHE_DIRECTORY)
 def iris():
     return load_file(filename='data/iris.txt', separator=',', normalize=True)
 
 
+def load_self_play(directory='data/self_play'):
+    filenames = sorted(glob.glob(os.path.join(directory, 'shard-*.npz')))
+    if not filenames:
+        raise Exception('No self-play shards found in {}'.format(directory))
+
+    features, distributions, winners = [], [], []
+    for filename in filenames:
+        with np.load(filename) as shard:
+            features.append(shard['features'])
+            distributions.append(shard['distributions'])
+            winners.append(shard['winners'])
+
+    return np.concatenate(features), np.concatenate(distributions), np.concatenate(winners)
+
+
+@register_data_source('self_play_policy')
+def self_play_policy():
+    print('Loading self-play policy cases...')
+    features, distributions, _ = load_self_play()
+    return features, distributions
+
+
+@register_data_source('self_play_value')
+def self_play_value():
+    print('Loading self-play value cases...')
+    features, _, winners = load_self_play()
+    labels = np.zeros((len(winners), 2))
+    labels[np.arange(len(winners)), winners.astype(int) - 1] = 1
+    return features, labels
+
+
 def get_cases_from_source(data_source):
-    if data_source == 'parity':
-        return parity()
-    elif data_source == 'bit_counter':
-        return bit_counter()
-    elif data_source == 'segment_counter':
-        return segment_counter()
-    elif data_source == 'symmetry':
-        return symmetry()
-    elif data_source == 'autoencoder_one_hot':
-        return autoencoder_one_hot()
-    elif data_source == 'autoencoder_dense':
-        return autoencoder_dense()
-    elif data_source == 'mnist':
-        return mnist()
-    elif data_source == 'wine':
-        return wine()
-    elif data_source == 'glass':
-        return glass()
-    elif data_source == 'yeast':
-        return yeast()
-    elif data_source == 'poker':
-        return poker()
-    elif data_source == 'iris':
-        return iris()
-    else:
-        pass
+    return get_data_source(data_source).loader()
+
+
+def to_arrays(cases, dtype=np.float64):
+    # Sources either return a list of (input, target) cases or a tuple of input and target arrays
+    if isinstance(cases, tuple):
+        inputs, targets = cases
+        return np.ascontiguousarray(inputs, dtype=dtype), np.ascontiguousarray(targets, dtype=dtype)
+
+    inputs = np.array([case[0] for case in cases], dtype=dtype)
+    targets = np.array([case[1] for case in cases], dtype=dtype)
+    return inputs, targets
+
+
+class MinibatchIterator:
+    """Infinite iterator over shuffled minibatches with epoch semantics.
+
+    The cases are permuted once per epoch and cut into contiguous batches, so every case is
+    visited once per epoch. With prefetch, the next batches are prepared on a background thread.
+    epoch is the (zero-based) epoch of the last batch returned, so it does not run ahead when the
+    prefetching thread does, and an error in that thread is raised by the next call to next().
+    """
+
+    def __init__(self, inputs, targets, size, prefetch=False):
+        self._inputs = inputs
+        self._targets = targets
+        self._size = max(1, min(size, len(inputs)))
+        # Own random state, so a prefetching thread does not race on the global numpy state
+        self._random = np.random.RandomState(np.random.randint(2 ** 31 - 1))
+        self._start(prefetch)
+
+    def _start(self, prefetch):
+        # Iteration, prefetch and error state shared with subclasses, which only override _generate_batches
+        self.epoch = 0
+        self._batches = self._generate_batches()
+        self._queue = None
+        self._error = None
+        self._stop = threading.Event()
+        if prefetch:
+            self._start_prefetching()
+
+    def _start_prefetching(self):
+        self._queue = queue.Queue(maxsize=2)
+        self._thread = threading.Thread(target=self._prefetch, daemon=True)
+        self._thread.start()
+
+    def _generate_batches(self):
+        # Batches carry their epoch, so the epoch is counted by the consumer
+        for epoch in itertools.count():
+            permutation = self._random.permutation(len(self._inputs))
+            inputs = self._inputs[permutation]
+            targets = self._targets[permutation]
+            for start in range(0, len(inputs), self._size):
+                yield epoch, (inputs[start:start + self._size], targets[start:start + self._size])
+
+    def _prefetch(self):
+        try:
+            for item in self._batches:
+                if not self._put(item):
+                    return
+        except Exception as error:
+            self._put(error)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._error:
+            raise self._error
+        if self._queue:
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._error = item
+                raise item
+        else:
+            item = next(self._batches)
+        self.epoch, batch = item
+        return batch
 
+    def close(self):
+        self._stop.set()
 
-class Cases:
-    def __init__(self, data_source, case_fraction, validation_fraction, test_fraction):
-        self._cases = get_cases_from_source(data_source)
 
-        array_of_cases = np.array(self._cases)
-        np.random.shuffle(array_of_cases)
-        self._cases = array_of_cases
+class StreamingMinibatchIterator(MinibatchIterator):
+    """Infinite iterator over freshly generated minibatches of a streaming source.
+
+    A background thread generates the next batches while the current one is trained on, so no
+    case is seen twice and nothing but the queued batches is held in memory.
+    """
+
+    def __init__(self, generate, size, dtype=np.float64):
+        self._generate = generate
+        self._size = max(1, size)
+        self._dtype = dtype
+        self._start(prefetch=True)
+
+    def _generate_batches(self):
+        while True:
+            yield 0, to_arrays(self._generate(self._size), dtype=self._dtype)
+
+
+class CasesLoader:
+    """Creates Cases, on a background thread if asked to, and hands them out once they are loaded.
+
+    The shuffling seed is drawn when the loader is created, so the cases and the global numpy
+    random state come out the same whether or not the cases load in the background.
+    """
+
+    def __init__(self, background=False, **arguments):
+        arguments.setdefault('seed', np.random.randint(2 ** 31 - 1))
+        self._arguments = arguments
+        self._cases = None
+        self._error = None
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._load, daemon=True)
+            self._thread.start()
+        else:
+            self._load()
+
+    def _load(self):
+        try:
+            self._cases = Cases(**self._arguments)
+        except Exception as error:
+            self._error = error
+
+    def result(self):
+        """Waits for the cases to load and returns them, raising any error from loading"""
+        if self._thread:
+            self._thread.join()
+        if self._error:
+            raise self._error
+        return self._cases
+
+
+class Cases:
+    def __init__(self, data_source, case_fraction, validation_fraction, test_fraction, dtype=np.float64,
+                 streaming=False, seed=None):
+        """With streaming, the source's cases are only held out for evaluation, and training minibatches are
+        generated on demand. The cases are shuffled with their own random state, seeded by seed or by the
+        global numpy random state."""
+        self._random = np.random.RandomState(np.random.randint(2 ** 31 - 1) if seed is None else seed)
+        source = get_data_source(data_source)
+        if streaming and not source.streaming:
+            raise ValueError('Data source "{}" cannot be streamed'.format(data_source))
+        self._stream = source.generate if streaming else None
+        self._dtype = dtype
+        inputs, targets = source.load(dtype=dtype)
+
+        # Fancy indexing with the permutation gives shuffled, contiguous copies
+        permutation = self._random.permutation(len(inputs))
+        self._inputs = inputs[permutation]
+        self._targets = targets[permutation]
         if 0.0 < case_fraction < 1.0:
-            self._cases = self._cases[:round(self._number_of_cases * case_fraction)]
+            number_of_cases = round(self._number_of_cases * case_fraction)
+            self._inputs = self._inputs[:number_of_cases]
+            self._targets = self._targets[:number_of_cases]
         self._case_fraction = case_fraction
         self._validation_fraction = validation_fraction
         self._test_fraction = test_fraction
-        (self.training_cases,
-         self.validation_cases,
-         self.test_cases) = self.organize_cases()
+        (self.training_inputs, self.training_targets,
+         self.validation_inputs, self.validation_targets,
+         self.test_inputs, self.test_targets) = self.organize_cases()
 
     def organize_cases(self):
-        # Split cases into training, validation and testing
+        # Split cases into training, validation and testing, the splits are views into the case arrays
         training_cases_end_index = round(
             (1 - (self._validation_fraction + self._test_fraction)) * self._number_of_cases
         )
         validation_cases_end_index = round(training_cases_end_index + self._validation_fraction * self._number_of_cases)
-        training_cases = self._cases[: training_cases_end_index]
-        validation_cases = self._cases[training_cases_end_index: validation_cases_end_index]
-        test_cases = self._cases[validation_cases_end_index:]
 
-        return training_cases, validation_cases, test_cases
+        return (
+            self._inputs[:training_cases_end_index],
+            self._targets[:training_cases_end_index],
+            self._inputs[training_cases_end_index:validation_cases_end_index],
+            self._targets[training_cases_end_index:validation_cases_end_index],
+            self._inputs[validation_cases_end_index:],
+            self._targets[validation_cases_end_index:],
+        )
+
+    def minibatches(self, size, prefetch=False):
+        if self._stream:
+            return StreamingMinibatchIterator(self._stream, size, dtype=self._dtype)
+        return MinibatchIterator(self.training_inputs, self.training_targets, size, prefetch=prefetch)
 
     def get_minibatch_of_size(self, size):
         number_of_cases = min(size, self.number_of_training_cases)
-        return random.sample(list(self.training_cases), number_of_cases)
+        indices = sorted(random.sample(range(self.number_of_training_cases), number_of_cases))
+        return self.training_inputs[indices], self.training_targets[indices]
 
     @property
     def number_of_training_cases(self):
-        return len(self.training_cases)
+        return len(self.training_inputs)
 
     @property
     def number_of_validation_cases(self):
-        return len(self.validation_cases)
+        return len(self.validation_inputs)
 
     @property
     def number_of_test_cases(self):
-        return len(self.test_cases)
+        return len(self.test_inputs)
 
     @property
     def _number_of_cases(self):
-        return len(self._cases)
+        return len(self._inputs)
 
     def get_input_size(self):
         if self._number_of_cases:
-            case = self._cases[0]
-            return len(case[0])
+            return self._inputs.shape[1]
         else:
             raise Exception('No cases found, can\'t calculate input size.')
 
     def get_output_size(self):
         if self._number_of_cases:
-            case = self._cases[0]
-            return len(case[1])
+            return self._targets.shape[1]
         else:
             raise Exception('No cases found, can\'t calculate output size.')
@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class _Request:
+    def __init__(self, features):
+        self.features = features
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceServer:
+    """Serves forward passes of one net to many concurrent callers.
+
+    Calling the server with a batch of feature vectors blocks until the output
+    rows are ready. Requests are collected on a background thread until
+    max_batch_size rows are pending or max_latency seconds have passed since the
+    first one arrived, and are then answered with a single Session.run.
+    """
+
+    def __init__(self, session, input_tensor, output_tensor, max_batch_size=256, max_latency=0.002):
+        self._session = session
+        self._input = input_tensor
+        self._output = output_tensor
+        self._max_batch_size = max_batch_size
+        self._max_latency = max_latency
+        self._requests = queue.Queue()
+        self._stopped = False
+        # Guards checking _stopped and enqueueing, so no request can be enqueued after the stop sentinel
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def __call__(self, features):
+        request = _Request(np.asarray(features))
+        with self._lock:
+            if self._stopped:
+                raise Exception('Inference server is stopped.')
+            self._requests.put(request)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.result
+
+    def stop(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._requests.put(None)
+        self._thread.join()
+
+    def _serve(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+
+            batch = [request]
+            batch_size = len(request.features)
+            deadline = time.perf_counter() + self._max_latency
+            stop = False
+            while batch_size < self._max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                batch_size += len(request.features)
+
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        try:
+            inputs = np.concatenate([request.features for request in batch])
+            outputs = self._session.run(self._output, feeder={self._input: inputs})
+        except Exception as error:
+            for request in batch:
+                request.error = error
+                request.done.set()
+            return
+
+        start = 0
+        for request in batch:
+            end = start + len(request.features)
+            request.result = outputs[start:end]
+            request.done.set()
+            start = end
@@ -38,8 +38,11 @@ class Layer:
 
 
 class InputLayer(Layer):
-    def build_layer(self):
-        self._output_before_activation = tf.placeholder(tf.float64, shape=self._size, name='Input')
+    def build_layer(self, default_input=None):
+        if default_input is None:
+            self._output_before_activation = tf.placeholder(self._net.dtype, shape=self._size, name='Input')
+        else:
+            self._output_before_activation = tf.placeholder_with_default(default_input, shape=self._size, name='Input')
         if self.layer_settings.normalize:
             self._output = tf.nn.l2_normalize(self._output_before_activation)
         else:
@@ -51,11 +54,11 @@ class DenseLayer(Layer):
         self._input = layer_input
 
         self.weights = tf.Variable(
-            get_distribution(self.layer_settings.weights, self._size),
+            get_distribution(self.layer_settings.weights, self._size, dtype=self._net.dtype.as_numpy_dtype),
             name=self._name + '-weights',
         )
         self.biases = tf.Variable(
-            get_distribution(self.layer_settings.biases, self._size[1]),
+            get_distribution(self.layer_settings.biases, self._size[1], dtype=self._net.dtype.as_numpy_dtype),
             name=self._name + '-bias',
         )
         self._output_before_activation = tf.matmul(self._input, self.weights) + self.biases
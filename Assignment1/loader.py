@@ -36,12 +36,7 @@ class Settings:
                 self.__setattr__(key, value)
 
 
-def load_settings():
-    parser = argparse.ArgumentParser(description='Build an artificial neural net from a specified settings file')
-    parser.add_argument('settings_file', help='Path to settings file for the network')
-    args = parser.parse_args()
-    filename = args.settings_file
-
+def load_settings_file(filename):
     with open('settings/default.json') as json_file:
         try:
             settings = Settings(json.load(json_file))
@@ -60,3 +55,9 @@ def load_settings():
 
     return settings
 
+
+def load_settings():
+    parser = argparse.ArgumentParser(description='Build an artificial neural net from a specified settings file')
+    parser.add_argument('settings_file', help='Path to settings file for the network')
+    args = parser.parse_args()
+    return load_settings_file(args.settings_file)
@@ -0,0 +1,63 @@
+import csv
+import json
+import os
+
+FIELDNAMES = ['step', 'error', 'learning_rate', 'step_time', 'training_accuracy', 'validation_error']
+
+
+class MetricsLogger:
+    """Streams training metrics to a JSON lines or CSV file, and optionally to TensorBoard.
+
+    Rows are buffered in memory and written buffer_size rows at a time, so logging every step
+    does not add a file write to every step. Values missing from a row (e.g. the validation error
+    outside validation steps) are left out of JSON lines and left empty in CSV. With append, rows
+    are added to an existing file, e.g. when a run resumes from a checkpoint.
+    """
+
+    def __init__(self, filename=None, file_format='jsonl', buffer_size=100, session=None, append=False):
+        self._buffer = []
+        self._buffer_size = max(buffer_size, 1)
+        self._session = session
+        self._file = None
+        self._writer = None
+        self._format = file_format
+        if filename:
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            mode = 'a' if append else 'w'
+            if file_format == 'jsonl':
+                self._file = open(filename, mode)
+            elif file_format == 'csv':
+                has_header = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+                self._file = open(filename, mode, newline='')
+                self._writer = csv.DictWriter(self._file, fieldnames=FIELDNAMES)
+                if not has_header:
+                    self._writer.writeheader()
+            else:
+                raise ValueError('Invalid metrics format: "{}"'.format(file_format))
+
+    def log(self, step, **values):
+        row = {'step': step}
+        row.update({key: float(value) for key, value in values.items() if value is not None})
+        if self._session:
+            self._session.add_scalars({key: value for key, value in row.items() if key != 'step'}, step)
+        if self._file:
+            self._buffer.append(row)
+            if len(self._buffer) >= self._buffer_size:
+                self.flush()
+
+    def flush(self):
+        if self._file and self._buffer:
+            if self._writer:
+                self._writer.writerows(self._buffer)
+            else:
+                self._file.write(''.join(json.dumps(row) + '\n' for row in self._buffer))
+            self._file.flush()
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
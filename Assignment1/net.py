@@ -1,18 +1,27 @@
 import argparse
+import json
+import os
+import time
 from loader import load_settings
 import math
+import numpy as np
 from utils import set_random_seed
 from plotter import Plotter
 import tensorflow as tf
-import tflowtools as TFT
-from cases import Cases
+from cases import CasesLoader, get_data_source
 from sessions import Session
+from inference import InferenceServer
 from layers import InputLayer, DenseLayer
+from metrics import MetricsLogger
+from profiler import Profiler
+from parallel import DataParallelTrainer
 
 
 class Net:
-    def __init__(self, settings):
+    def __init__(self, settings, input_size=None, output_size=None):
+        """Without sizes, the net loads its cases. With sizes, it only builds the graph (data parallel workers)"""
         self._settings = settings
+        self._dtype = tf.as_dtype(self._settings.dtype)
         self._layers = []
         self._input = None
         self._output = None
@@ -20,32 +29,251 @@ class Net:
         self._error = None
         self._optimizer = None
         self._trainer = None
+        self._correct = None
         self._learning_rate = self._settings.learning_rate
         self._learning_rate_placeholder = None
         self._training_error_history = []
         self._validation_error_history = []
-        self._cases = self._generate_cases()
+        self._dataset_iterator = None
+        self._pipeline_inputs = None
+        self._pipeline_targets = None
+        self._pipeline_next_inputs = None
+        self._pipeline_next_targets = None
+        self._start_step = 1
+        self._best_validation_error = math.inf
+        self._intervals_without_improvement = 0
+        self._variables = None
+        self._gradients = None
+        self._gradient_placeholders = None
+        self._apply_gradients = None
+        self._parameter_placeholders = None
+        self._assign_parameters = None
+        self._data_parallel_trainer = None
+        if self._settings.workers > 1 and self._use_dataset_pipeline:
+            raise ValueError('Data parallel training requires the "feed" input pipeline')
+        if self._settings.streaming and self._use_dataset_pipeline:
+            raise ValueError('Streaming data sources require the "feed" input pipeline')
+        self._case_loader = None
+        if input_size is None:
+            source = get_data_source(self._settings.data_source)
+            # Only sources with declared sizes can load while the graph is built, and only sources read from
+            # disk do, since the synthetic generators draw from the global numpy random state the weights use
+            background = self._settings.background_loading and source.has_sizes and source.cache_directory
+            self._case_loader = self._generate_cases(background=bool(background))
+            # Declared sizes are checked against the data when the source loads
+            if source.has_sizes:
+                input_size, output_size = source.input_size, source.output_size
+            else:
+                input_size = self._cases.get_input_size()
+                output_size = self._cases.get_output_size()
+        self._input_size = input_size
+        self._output_size = output_size
         self._build()
         self._setup_learning()
-        self._session = Session(use_tensorboard=False)
+        self._session = Session(
+            directory=self._settings.metrics.tensorboard_directory,
+            use_tensorboard=self._settings.metrics.tensorboard,
+        )
+        self._initialize_input_pipeline()
+        self._restore_checkpoint()
+        self._start_data_parallel_workers()
+        self._metrics_logger = self._create_metrics_logger()
+        self._profiler = Profiler(
+            enabled=self._settings.profile.enabled,
+            trace_steps=self._settings.profile.trace_steps,
+            trace_directory=self._settings.profile.trace_directory,
+        )
         self._plotter = Plotter()
 
-    def _generate_cases(self):
-        return Cases(
+    def _generate_cases(self, background=False):
+        return CasesLoader(
+            background=background,
             data_source=self._settings.data_source,
             case_fraction=self._settings.case_fraction,
             validation_fraction=self._settings.validation_fraction,
-            test_fraction=self._settings.test_fraction
+            test_fraction=self._settings.test_fraction,
+            dtype=self._dtype.as_numpy_dtype,
+            streaming=self._settings.streaming,
+        )
+
+    @property
+    def _cases(self):
+        # Joins a background load the first time the cases are needed
+        return self._case_loader.result() if self._case_loader else None
+
+    def _create_metrics_logger(self):
+        metrics_settings = self._settings.metrics
+        return MetricsLogger(
+            filename=metrics_settings.file or None,
+            file_format=metrics_settings.format,
+            buffer_size=metrics_settings.buffer_size,
+            session=self._session if metrics_settings.tensorboard else None,
+            # Continue the metrics of the earlier run when a checkpoint was restored
+            append=self._start_step > 1,
+        )
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def export(self, filename):
+        """Saves the dense layer parameters and activations for use with predictor.Predictor"""
+        dense_layers = self._layers[1:]
+        grabbed_values, _ = self._run([[layer.weights, layer.biases] for layer in dense_layers])
+        arrays = {}
+        for index, (weights, biases) in enumerate(grabbed_values):
+            arrays['weights_{}'.format(index)] = weights
+            arrays['biases_{}'.format(index)] = biases
+        np.savez(
+            filename,
+            number_of_layers=len(dense_layers),
+            activations=np.array([layer.layer_settings.activation or '' for layer in dense_layers]),
+            normalize_input=bool(self._settings.input_layer.normalize),
+            **arrays
         )
 
+    def _save_checkpoint(self, step_number):
+        directory = self._settings.checkpoint.directory
+        self._session.save(directory, step_number)
+        training_state = {
+            'step': step_number,
+            'learning_rate': self._learning_rate,
+            'training_error_history': [(step, float(error)) for step, error in self._training_error_history],
+            'validation_error_history': [(step, float(error)) for step, error in self._validation_error_history],
+            # JSON has no infinity, None means no validation error has been seen yet
+            'best_validation_error': (
+                float(self._best_validation_error) if math.isfinite(self._best_validation_error) else None
+            ),
+            'intervals_without_improvement': self._intervals_without_improvement,
+        }
+        with open(os.path.join(directory, 'training_state.json'), 'w') as json_file:
+            json.dump(training_state, json_file)
+
+    def _restore_checkpoint(self):
+        if not (self._settings.checkpoint.directory and self._settings.checkpoint.resume):
+            return
+        directory = self._settings.checkpoint.directory
+        checkpoint = self._session.restore(directory)
+        if checkpoint is None:
+            print('No checkpoint found in {}, starting from scratch'.format(directory))
+            return
+
+        with open(os.path.join(directory, 'training_state.json')) as json_file:
+            training_state = json.load(json_file)
+        self._start_step = training_state['step'] + 1
+        self._learning_rate = training_state['learning_rate']
+        self._training_error_history = [tuple(entry) for entry in training_state['training_error_history']]
+        self._validation_error_history = [tuple(entry) for entry in training_state['validation_error_history']]
+        best_validation_error = training_state.get('best_validation_error')
+        self._best_validation_error = math.inf if best_validation_error is None else best_validation_error
+        self._intervals_without_improvement = training_state.get('intervals_without_improvement', 0)
+        print('Resuming from {} at step {}'.format(checkpoint, self._start_step))
+
+    def _should_stop_early(self, validation_error):
+        patience = self._settings.early_stopping.patience
+        if not patience:
+            return False
+        if validation_error < self._best_validation_error - self._settings.early_stopping.min_delta:
+            self._best_validation_error = validation_error
+            self._intervals_without_improvement = 0
+        else:
+            self._intervals_without_improvement += 1
+        return self._intervals_without_improvement >= patience
+
     def finish(self):
+        if self._data_parallel_trainer:
+            self._data_parallel_trainer.close()
+        self._metrics_logger.close()
         self._session.close()
 
+    def _setup_data_parallel(self):
+        # Ops to compute gradients and overwrite parameters in the workers, and to apply averaged gradients
+        self._variables = tf.trainable_variables()
+        self._gradients = tf.gradients(self._error, self._variables)
+        self._gradient_placeholders = [tf.placeholder(self._dtype, shape=v.shape) for v in self._variables]
+        self._apply_gradients = self._optimizer.apply_gradients(zip(self._gradient_placeholders, self._variables))
+        self._parameter_placeholders = [tf.placeholder(self._dtype, shape=v.shape) for v in self._variables]
+        self._assign_parameters = tf.group(*[
+            variable.assign(placeholder) for variable, placeholder in zip(self._variables, self._parameter_placeholders)
+        ])
+
+    def _start_data_parallel_workers(self):
+        if self._settings.workers > 1 and self._case_loader is not None:
+            self._data_parallel_trainer = DataParallelTrainer(
+                settings=self._settings,
+                input_size=self._input_size,
+                output_size=self._output_size,
+                parameter_shapes=self.get_parameter_shapes(),
+                dtype=self._dtype.as_numpy_dtype,
+                number_of_workers=self._settings.workers,
+            )
+
+    def get_parameter_shapes(self):
+        return [tuple(variable.shape.as_list()) for variable in self._variables]
+
+    def set_parameters(self, parameters):
+        feeder = {placeholder: value for placeholder, value in zip(self._parameter_placeholders, parameters)}
+        self._run([self._assign_parameters], feeder=feeder)
+
+    def compute_gradients(self, inputs, targets):
+        feeder = {
+            self._input: inputs,
+            self._target: targets,
+        }
+        grabbed_values, _ = self._run([self._gradients, self._error], feeder=feeder)
+        gradients, error = grabbed_values
+        return gradients, error
+
+    def _run_data_parallel_step(self, inputs, targets, options=None, run_metadata=None):
+        # The gradients are computed in the worker processes, so a traced step only traces applying them
+        parameters, _ = self._run(self._variables)
+        gradients, error = self._data_parallel_trainer.compute_gradients(parameters, inputs, targets)
+        feeder = {placeholder: gradient for placeholder, gradient in zip(self._gradient_placeholders, gradients)}
+        feeder[self._learning_rate_placeholder] = self._learning_rate
+        self._run([self._apply_gradients], feeder=feeder, options=options, run_metadata=run_metadata)
+        return [error]
+
+    def serve(self, max_batch_size=256, max_latency=0.002):
+        return InferenceServer(
+            session=self._session,
+            input_tensor=self._input,
+            output_tensor=self._output,
+            max_batch_size=max_batch_size,
+            max_latency=max_latency,
+        )
+
+    @property
+    def _use_dataset_pipeline(self):
+        return self._settings.input_pipeline == 'dataset'
+
+    def _setup_input_pipeline(self):
+        # The training arrays are fed once through placeholders, so they are not embedded in the graph. The
+        # shapes only use the layer sizes, so the graph can be built before the cases have loaded
+        self._pipeline_inputs = tf.placeholder(self._dtype, shape=(None, self._input_size), name='PipelineInputs')
+        self._pipeline_targets = tf.placeholder(self._dtype, shape=(None, self._output_size), name='PipelineTargets')
+        dataset = tf.data.Dataset.from_tensor_slices((self._pipeline_inputs, self._pipeline_targets))
+        number_of_cases = tf.shape(self._pipeline_inputs, out_type=tf.int64)[0]
+        dataset = dataset.shuffle(buffer_size=number_of_cases).repeat()
+        dataset = dataset.batch(self._settings.minibatch_size).prefetch(1)
+        self._dataset_iterator = dataset.make_initializable_iterator()
+        self._pipeline_next_inputs, self._pipeline_next_targets = self._dataset_iterator.get_next()
+
+    def _initialize_input_pipeline(self):
+        if self._dataset_iterator:
+            feeder = {
+                self._pipeline_inputs: self._cases.training_inputs,
+                self._pipeline_targets: self._cases.training_targets,
+            }
+            self._session.run(self._dataset_iterator.initializer, feeder=feeder)
+
     def _build(self):
+        if self._use_dataset_pipeline:
+            self._setup_input_pipeline()
+
         # Create input layer
-        input_layer = InputLayer(layer_settings=self._settings.input_layer, size=(None, self._cases.get_input_size()))
+        input_layer = InputLayer(layer_settings=self._settings.input_layer, size=(None, self._input_size))
         input_layer.setup(net=self, name='InputLayer')
-        input_layer.build_layer()
+        input_layer.build_layer(default_input=self._pipeline_next_inputs)
         self._input = input_layer.get_layer_output_before_activation()
         self._layers.append(input_layer)
 
@@ -65,7 +293,7 @@ class Net:
         output_layer_settings = self._settings.output_layer
         output_layer = DenseLayer(
             layer_settings=output_layer_settings,
-            size=(last_layer.out_size, self._cases.get_output_size()),
+            size=(last_layer.out_size, self._output_size),
         )
         output_layer.setup(net=self, name='OutLayer')
         output_layer.build_layer(layer_input=last_layer.get_layer_output())
@@ -74,8 +302,12 @@ class Net:
         self._layers.append(output_layer)
 
     def _setup_learning(self):
-        self._target = tf.placeholder(tf.float64, shape=(None, self._cases.get_output_size()), name='Target')
-        self._learning_rate_placeholder = tf.placeholder(tf.float64, name='LearningRate')
+        target_shape = (None, self._output_size)
+        if self._pipeline_next_targets is not None:
+            self._target = tf.placeholder_with_default(self._pipeline_next_targets, shape=target_shape, name='Target')
+        else:
+            self._target = tf.placeholder(self._dtype, shape=target_shape, name='Target')
+        self._learning_rate_placeholder = tf.placeholder(self._dtype, name='LearningRate')
 
         # Set error function
         if self._settings.error_function == 'mse':
@@ -104,80 +336,176 @@ class Net:
             self._optimizer = tf.train.RMSPropOptimizer(learning_rate=self._learning_rate_placeholder)
 
         self._trainer = self._optimizer.minimize(self._error, name='Backprop')
+        if self._settings.workers > 1:
+            self._setup_data_parallel()
 
-    def _run(self, operators, grabbed_vars=None, feeder=None):
+        # Set testing function, built once so repeated tests do not grow the graph
+        if self._settings.testing == 'classification':
+            test = tf.equal(tf.argmax(self._output, 1), tf.argmax(self._target, 1))
+        elif self._settings.testing == 'equal':
+            test = tf.reduce_all(tf.equal(self._output, self._target), axis=1)
+        else:
+            test = None
+
+        if test is not None:
+            self._correct = tf.reduce_sum(tf.cast(test, tf.int64), name='Correct')
+
+    def _run(self, operators, grabbed_vars=None, feeder=None, options=None, run_metadata=None):
         if grabbed_vars:
-            results = self._session.run([operators, grabbed_vars], feeder=feeder)
+            results = self._session.run([operators, grabbed_vars], feeder=feeder, options=options,
+                                        run_metadata=run_metadata)
             return results[0], results[1]
         else:
-            results = self._session.run([operators], feeder=feeder)
+            results = self._session.run([operators], feeder=feeder, options=options, run_metadata=run_metadata)
             return results[0], None
 
     def train(self):
-        for step_number in range(1, self._settings.steps + 1):
+        minibatches = None
+        if not self._use_dataset_pipeline:
+            minibatches = self._cases.minibatches(self._settings.minibatch_size, prefetch=self._settings.prefetch)
+        checkpoint_directory = self._settings.checkpoint.directory
+        step_number = saved_step_number = self._start_step - 1
+        profiler = self._profiler
+        for step_number in range(self._start_step, self._settings.steps + 1):
             grab_variables = [self._error]
-            minibatch = self._cases.get_minibatch_of_size(self._settings.minibatch_size)
             self._learning_rate *= self._settings.delta_learning_rate
+            number_of_examples = self._settings.minibatch_size
+            start_time = time.perf_counter()
+            if minibatches:
+                inputs, targets = next(minibatches)
+                number_of_examples = len(inputs)
+            sampled_time = time.perf_counter()
             feeder = {
-                self._input: [case[0] for case in minibatch],
-                self._target: [case[1] for case in minibatch],
                 self._learning_rate_placeholder: self._learning_rate,
             }
-            _, grabbed_values = self._run([self._trainer], grab_variables, feeder=feeder)
+            if minibatches:
+                feeder[self._input] = inputs
+                feeder[self._target] = targets
+            fed_time = time.perf_counter()
+            options = run_metadata = None
+            if profiler.should_trace(step_number):
+                options, run_metadata = profiler.get_run_options()
+            if self._data_parallel_trainer:
+                grabbed_values = self._run_data_parallel_step(inputs, targets, options=options,
+                                                              run_metadata=run_metadata)
+            else:
+                _, grabbed_values = self._run([self._trainer], grab_variables, feeder=feeder, options=options,
+                                              run_metadata=run_metadata)
+            run_time = time.perf_counter()
+            step_time = run_time - fed_time
+            if run_metadata is not None:
+                # Saved after the step is timed, so writing the trace is not counted as run time
+                trace_file = profiler.save_trace(step_number, run_metadata)
+                print('Saved trace of step {} to {}'.format(step_number, trace_file))
+            if profiler.enabled:
+                profiler.add('sampling', sampled_time - start_time)
+                profiler.add('feed', fed_time - sampled_time)
+                profiler.add('run', step_time)
+                profiler.add_step(number_of_examples)
+            training_accuracy = None
+            validation_error = None
+            stop_early = False
             if step_number % self._settings.validation_interval == 0:
-                self.display_grabbed_values(grabbed_values, step_number)
-                feeder = {
-                    self._input: [case[0] for case in self._cases.training_cases],
-                    self._target: [case[1] for case in self._cases.training_cases],
-                }
-                grabbed_values = self._run([self._error], feeder=feeder)
-                self._training_error_history.append((step_number, grabbed_values[0]))
+                training_error, training_accuracy = self._evaluate(
+                    self._cases.training_inputs,
+                    self._cases.training_targets,
+                )
+                self.display_grabbed_values(grabbed_values, step_number, training_accuracy)
+                self._training_error_history.append((step_number, training_error))
 
                 if self._cases.number_of_validation_cases:
-                    feeder = {
-                        self._input: [case[0] for case in self._cases.validation_cases],
-                        self._target: [case[1] for case in self._cases.validation_cases],
-                    }
-                    grabbed_values = self._run([self._error], feeder=feeder)
-                    self._validation_error_history.append((step_number, grabbed_values[0]))
-
-    def display_grabbed_values(self, values, step):
+                    validation_error, _ = self._evaluate(
+                        self._cases.validation_inputs,
+                        self._cases.validation_targets,
+                    )
+                    self._validation_error_history.append((step_number, validation_error))
+                    stop_early = self._should_stop_early(validation_error)
+                if profiler.enabled:
+                    profiler.add('validation', time.perf_counter() - run_time)
+
+            self._log_metrics(step_number, grabbed_values, step_time, training_accuracy, validation_error)
+            if stop_early:
+                print('Stopping early at step {}, no validation improvement in {} intervals'.format(
+                    step_number,
+                    self._intervals_without_improvement,
+                ))
+                break
+            if checkpoint_directory and step_number % self._settings.checkpoint.interval == 0:
+                self._save_checkpoint(step_number)
+                saved_step_number = step_number
+        if minibatches:
+            minibatches.close()
+        self._metrics_logger.flush()
+        if checkpoint_directory and step_number != saved_step_number:
+            self._save_checkpoint(step_number)
+        if profiler.enabled:
+            profiler.report()
+
+    def _log_metrics(self, step_number, grabbed_values, step_time, training_accuracy, validation_error):
+        self._metrics_logger.log(
+            step_number,
+            error=grabbed_values[0],
+            learning_rate=self._learning_rate,
+            step_time=step_time,
+            training_accuracy=training_accuracy,
+            validation_error=validation_error,
+        )
+
+    def display_grabbed_values(self, values, step, training_accuracy):
         print('Step {0:>5}, Error: {1:.5f}, Learning Rate: {2:.5f}, Training Accuracy: {3:.3f}%'.format(
             step,
             values[0],
             self._learning_rate,
-            self._run_test(self._cases.training_cases)
+            training_accuracy,
         ))
 
-    def _run_test(self, cases):
-        feeder = {
-            self._input: [case[0] for case in cases],
-            self._target: [case[1] for case in cases],
-        }
-
-        if self._settings.testing == 'classification':
-            test = tf.equal(tf.argmax(self._output, 1), tf.argmax(self._target, 1))
-        elif self._settings.testing == 'equal':
-            test = tf.map_fn(lambda x: tf.reduce_all(x), tf.equal(self._output, self._target))
-        else:
-            test = None
-
-        grabbed_vars = self._run([test], feeder=feeder)
+    def _evaluate(self, inputs, targets):
+        """Returns the error and accuracy of a split, running error and correct count together per chunk"""
+        number_of_cases = len(inputs)
+        chunk_size = self._settings.evaluation_chunk_size or number_of_cases
+        total_error = 0.0
+        total_correct = 0
+        for start in range(0, number_of_cases, chunk_size):
+            end = min(start + chunk_size, number_of_cases)
+            feeder = {
+                self._input: inputs[start:end],
+                self._target: targets[start:end],
+            }
+            grabbed_vars, _ = self._run([self._error, self._correct], feeder=feeder)
+            error, correct = grabbed_vars
+            # The error is a mean over the chunk, weight it by the chunk size to get the mean over the split
+            total_error += error * (end - start)
+            total_correct += correct
+        return total_error / number_of_cases, (total_correct / number_of_cases) * 100
 
-        correct = 0
-        for test_result in grabbed_vars[0][0]:
-            if test_result:
-                correct += 1
-        return (correct / len(cases)) * 100
+    def _run_test(self, inputs, targets):
+        _, accuracy = self._evaluate(inputs, targets)
+        return accuracy
 
     def test(self):
         print(' ')
-        training_accuracy = self._run_test(self._cases.training_cases)
+        training_accuracy = self._run_test(self._cases.training_inputs, self._cases.training_targets)
         print('Training accuracy: {0:.2f}%'.format(training_accuracy))
         if self._cases.number_of_test_cases:
-            test_accuracy = self._run_test(self._cases.test_cases)
+            test_error, test_accuracy = self._evaluate(self._cases.test_inputs, self._cases.test_targets)
+            print('Test error: {0:.5f}'.format(test_error))
             print('Test accuracy: {0:.2f}%'.format(test_accuracy))
 
+    def get_metrics(self):
+        metrics = {
+            'training_error': self._training_error_history[-1][1] if self._training_error_history else None,
+            'validation_error': self._validation_error_history[-1][1] if self._validation_error_history else None,
+            'training_accuracy': self._run_test(self._cases.training_inputs, self._cases.training_targets),
+            'test_error': None,
+            'test_accuracy': None,
+        }
+        if self._cases.number_of_test_cases:
+            metrics['test_error'], metrics['test_accuracy'] = self._evaluate(
+                self._cases.test_inputs,
+                self._cases.test_targets,
+            )
+        return metrics
+
     def _generate_error_plots(self):
         if self._settings.visualization.error:
             x_axis = [x[0] for x in self._training_error_history]
@@ -190,7 +518,7 @@ class Net:
 
     def _generate_layer_mappings(self):
         if self._settings.visualization.mappings:
-            cases = self._cases.get_minibatch_of_size(self._settings.map_batch_size)
+            inputs, targets = self._cases.get_minibatch_of_size(self._settings.map_batch_size)
             variables = []
             labels = []
             for layer in self._layers:
@@ -200,8 +528,8 @@ class Net:
                     variables.append(out)
 
             feeder = {
-                self._input: [case[0] for case in cases],
-                self._target: [case[1] for case in cases],
+                self._input: inputs,
+                self._target: targets,
 
             }
             _, grabbed_values = self._run([self._error], variables, feeder=feeder)
@@ -258,7 +586,7 @@ class Net:
 
     def _generate_dendrograms(self):
         if self._settings.visualization.dendrograms:
-            cases = self._cases.get_minibatch_of_size(self._settings.map_batch_size)
+            inputs, targets = self._cases.get_minibatch_of_size(self._settings.map_batch_size)
             variables = []
             labels = []
             for layer in self._layers:
@@ -267,13 +595,12 @@ class Net:
                     out = layer.get_layer_output()
                     variables.append(out)
 
-            targets = [case[1] for case in cases]
             feeder = {
-                self._input: [case[0] for case in cases],
+                self._input: inputs,
             }
             grabbed_values, _ = self._run(variables, feeder=feeder)
             for index, grabbed_value in enumerate(grabbed_values):
-                target_labels = ["".join([str(t) for t in target]) for target in targets]
+                target_labels = ["".join(['{:g}'.format(t) for t in target]) for target in targets]
                 self._plotter.add_dendrogram_plot(grabbed_value, label=labels[index], labels=target_labels)
 
     def pre_visualize(self):
@@ -297,6 +624,8 @@ def main():
     net.train()
     net.test()
     net.post_visualize()
+    if settings.export_file:
+        net.export(settings.export_file)
     net.finish()
 
 
@@ -0,0 +1,151 @@
+import multiprocessing
+import queue
+import traceback
+
+import numpy as np
+
+
+def get_shared_view(shared_array, dtype, shape):
+    return np.frombuffer(shared_array, dtype=dtype).reshape(shape)
+
+
+def run_worker(index, settings, input_size, output_size, max_batch_size, shared_arrays, task_queue, done_queue):
+    # Any failure is reported on the done queue, so the parent raises it instead of waiting forever
+    try:
+        serve_tasks(index, settings, input_size, output_size, max_batch_size, shared_arrays, task_queue, done_queue)
+    except Exception:
+        done_queue.put((index, None, traceback.format_exc()))
+
+
+def serve_tasks(index, settings, input_size, output_size, max_batch_size, shared_arrays, task_queue, done_queue):
+    # Imported here, so the spawned worker builds its own graph and session
+    from net import Net
+
+    settings.input_pipeline = 'feed'
+    settings.checkpoint.resume = False
+    settings.metrics.file = False
+    settings.metrics.tensorboard = False
+    net = Net(settings=settings, input_size=input_size, output_size=output_size)
+    dtype = net.dtype.as_numpy_dtype
+    shapes = net.get_parameter_shapes()
+    number_of_parameters = sum(int(np.prod(shape)) for shape in shapes)
+
+    shared_parameters, shared_gradients, shared_inputs, shared_targets = shared_arrays
+    parameters = get_shared_view(shared_parameters, dtype, (number_of_parameters,))
+    gradients = get_shared_view(shared_gradients, dtype, (-1, number_of_parameters))[index]
+    inputs = get_shared_view(shared_inputs, dtype, (max_batch_size, input_size))
+    targets = get_shared_view(shared_targets, dtype, (max_batch_size, output_size))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        start, end = task
+        net.set_parameters(unflatten(parameters, shapes))
+        shard_gradients, error = net.compute_gradients(inputs[start:end], targets[start:end])
+        gradients[:] = flatten(shard_gradients)
+        done_queue.put((index, error, None))
+
+    net.finish()
+
+
+def flatten(arrays):
+    return np.concatenate([np.ravel(array) for array in arrays])
+
+
+def unflatten(vector, shapes):
+    arrays = []
+    start = 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        arrays.append(vector[start:start + size].reshape(shape))
+        start += size
+    return arrays
+
+
+class DataParallelTrainer:
+    """Computes minibatch gradients synchronously on several worker processes.
+
+    The parameters, the minibatch and one gradient slot per worker live in shared memory. Each
+    worker computes the gradient of its shard of the minibatch, and the shard gradients are averaged,
+    weighted by shard size, into the gradient of the whole minibatch.
+    """
+
+    def __init__(self, settings, input_size, output_size, parameter_shapes, dtype, number_of_workers):
+        self._shapes = parameter_shapes
+        self._dtype = dtype
+        self._number_of_workers = number_of_workers
+        self._max_batch_size = settings.minibatch_size
+        number_of_parameters = sum(int(np.prod(shape)) for shape in parameter_shapes)
+
+        context = multiprocessing.get_context('spawn')
+        typecode = 'f' if np.dtype(dtype) == np.float32 else 'd'
+        shared_arrays = (
+            context.RawArray(typecode, number_of_parameters),
+            context.RawArray(typecode, number_of_workers * number_of_parameters),
+            context.RawArray(typecode, self._max_batch_size * input_size),
+            context.RawArray(typecode, self._max_batch_size * output_size),
+        )
+        self._parameters = get_shared_view(shared_arrays[0], dtype, (number_of_parameters,))
+        self._gradients = get_shared_view(shared_arrays[1], dtype, (number_of_workers, number_of_parameters))
+        self._inputs = get_shared_view(shared_arrays[2], dtype, (self._max_batch_size, input_size))
+        self._targets = get_shared_view(shared_arrays[3], dtype, (self._max_batch_size, output_size))
+
+        self._task_queues = [context.Queue() for _ in range(number_of_workers)]
+        self._done_queue = context.Queue()
+        self._processes = []
+        for index in range(number_of_workers):
+            process = context.Process(
+                target=run_worker,
+                args=(index, settings, input_size, output_size, self._max_batch_size, shared_arrays,
+                      self._task_queues[index], self._done_queue),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+    def compute_gradients(self, parameters, inputs, targets):
+        """Returns the gradients and error of the minibatch, averaged over the worker shards"""
+        number_of_cases = len(inputs)
+        self._parameters[:] = flatten(parameters)
+        self._inputs[:number_of_cases] = inputs
+        self._targets[:number_of_cases] = targets
+
+        shard_bounds = np.linspace(0, number_of_cases, self._number_of_workers + 1).astype(int)
+        shard_sizes = {}
+        for index in range(self._number_of_workers):
+            start, end = shard_bounds[index], shard_bounds[index + 1]
+            if end > start:
+                shard_sizes[index] = end - start
+                self._task_queues[index].put((start, end))
+
+        gradients = np.zeros(self._parameters.shape, dtype=self._dtype)
+        error = 0.0
+        for _ in range(len(shard_sizes)):
+            index, shard_error, failure = self._get_done()
+            if failure:
+                raise RuntimeError('Data parallel worker {} failed:\n{}'.format(index, failure))
+            weight = shard_sizes[index] / number_of_cases
+            gradients += weight * self._gradients[index]
+            error += weight * shard_error
+        return unflatten(gradients, self._shapes), error
+
+    def _get_done(self, poll_interval=1.0):
+        while True:
+            try:
+                return self._done_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                for index, process in enumerate(self._processes):
+                    if not process.is_alive():
+                        raise RuntimeError('Data parallel worker {} exited with code {}'.format(
+                            index,
+                            process.exitcode,
+                        ))
+
+    def close(self):
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
@@ -1,5 +1,3 @@
-import matplotlib.pyplot as plt
-import scipy.cluster.hierarchy as sch
 import numpy as np
 
 
@@ -14,6 +12,7 @@ def create_hinton_plot(
         scale=True,
         label='Hinton plot',
 ):
+    import matplotlib.pyplot as plt
     colors = ('gray', 'red', 'blue', 'white')
     if transpose:
         matrix = matrix.transpose()
@@ -55,6 +54,7 @@ def create_matrix_plot(
         tsize=8,
         cutoff=0.1,
 ):
+    import matplotlib.pyplot as plt
     colors = ('red', 'yellow', 'grey', 'blue')
     if transpose:
         matrix = matrix.transpose()
@@ -87,6 +87,7 @@ def create_matrix_plot(
 
 
 def create_error_plot(error_plots):
+    import matplotlib.pyplot as plt
     title = 'Error History'
     figure = plt.figure()
     figure.canvas.set_window_title(title)
@@ -112,6 +113,8 @@ def create_dendrogram(
         orient='top',
         lrot=90.0
 ):
+    import matplotlib.pyplot as plt
+    import scipy.cluster.hierarchy as sch
     axes = figure.gca()
     cluster_history = sch.linkage(features,method=mode,metric=metric)
     sch.dendrogram(cluster_history,labels=labels,orientation=orient,leaf_rotation=lrot)
@@ -120,6 +123,7 @@ def create_dendrogram(
 
 
 def get_figure_with_title(title):
+    import matplotlib.pyplot as plt
     figure = plt.figure()
     figure.canvas.set_window_title(title)
     figure.suptitle(title)
@@ -180,7 +184,23 @@ class Plotter:
             'label': label,
         })
 
+    def has_plots(self):
+        return any((
+            self._error_plots,
+            self._hinton_plots,
+            self._start_weights,
+            self._end_weights,
+            self._start_biases,
+            self._end_biases,
+            self._dendrograms,
+        ))
+
     def plot(self):
+        # Nothing to show, so matplotlib is never imported
+        if not self.has_plots():
+            return
+        import matplotlib.pyplot as plt
+
         # Error plots
         if len(self._error_plots):
             create_error_plot(self._error_plots)
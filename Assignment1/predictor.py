@@ -0,0 +1,66 @@
+import numpy as np
+
+
+def relu(x):
+    return np.maximum(x, 0)
+
+
+def softmax(x):
+    exponentials = np.exp(x - x.max(axis=1, keepdims=True))
+    return exponentials / exponentials.sum(axis=1, keepdims=True)
+
+
+def sigmoid(x):
+    # Rounded, like the sigmoid activation in layers.py
+    return np.round(1 / (1 + np.exp(-x)))
+
+
+ACTIVATION_FUNCTIONS = {
+    'relu': relu,
+    'softmax': softmax,
+    'sigmoid': sigmoid,
+    'tanh': np.tanh,
+}
+
+
+class Predictor:
+    """Forward pass of an exported net in plain NumPy, see Net.export"""
+
+    def __init__(self, weights, biases, activations, normalize_input=False):
+        self._weights = weights
+        self._biases = biases
+        self._activations = activations
+        self._normalize_input = normalize_input
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as data:
+            number_of_layers = int(data['number_of_layers'])
+            return Predictor(
+                weights=[data['weights_{}'.format(index)] for index in range(number_of_layers)],
+                biases=[data['biases_{}'.format(index)] for index in range(number_of_layers)],
+                activations=[str(activation) for activation in data['activations']],
+                normalize_input=bool(data['normalize_input']),
+            )
+
+    @property
+    def input_size(self):
+        return self._weights[0].shape[0]
+
+    @property
+    def output_size(self):
+        return self._weights[-1].shape[1]
+
+    def predict(self, inputs):
+        outputs = np.asarray(inputs, dtype=self._weights[0].dtype)
+        if self._normalize_input:
+            # tf.nn.l2_normalize without an axis normalizes over the whole batch
+            outputs = outputs / np.sqrt(max(np.sum(outputs ** 2), 1e-12))
+        for weights, biases, activation in zip(self._weights, self._biases, self._activations):
+            outputs = outputs @ weights + biases
+            if activation:
+                outputs = ACTIVATION_FUNCTIONS[activation](outputs)
+        return outputs
+
+    def __call__(self, inputs):
+        return self.predict(inputs)
@@ -0,0 +1,69 @@
+import os
+
+SECTIONS = ['sampling', 'feed', 'run', 'validation']
+
+
+class Profiler:
+    """Accumulates the wall time of each part of a training step, and traces selected steps.
+
+    Sampling is drawing the minibatch, feed is building the feed dict, run is the training
+    session.run and validation is the periodic evaluation of the training and validation sets.
+    Traced steps are run with full TF tracing and saved as Chrome trace files, which can be
+    opened in chrome://tracing. With data-parallel training only applying the averaged gradients is
+    traced, since the gradients are computed in the worker processes.
+    """
+
+    def __init__(self, enabled=False, trace_steps=None, trace_directory='traces'):
+        self.enabled = enabled
+        self._trace_steps = set(trace_steps or [])
+        self._trace_directory = trace_directory
+        self._times = {section: 0.0 for section in SECTIONS}
+        self._steps = 0
+        self._examples = 0
+
+    def add(self, section, seconds):
+        self._times[section] += seconds
+
+    def add_step(self, number_of_examples):
+        self._steps += 1
+        self._examples += number_of_examples
+
+    def should_trace(self, step):
+        return self.enabled and step in self._trace_steps
+
+    @staticmethod
+    def get_run_options():
+        import tensorflow as tf
+
+        return tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE), tf.RunMetadata()
+
+    def save_trace(self, step, run_metadata):
+        from tensorflow.python.client import timeline
+
+        os.makedirs(self._trace_directory, exist_ok=True)
+        filename = os.path.join(self._trace_directory, 'step-{}.json'.format(step))
+        with open(filename, 'w') as trace_file:
+            trace_file.write(timeline.Timeline(run_metadata.step_stats).generate_chrome_trace_format())
+        return filename
+
+    def get_summary(self):
+        total = sum(self._times.values())
+        summary = {section + '_seconds': seconds for section, seconds in self._times.items()}
+        summary['total_seconds'] = total
+        summary['steps'] = self._steps
+        summary['examples_per_second'] = self._examples / total if total > 0 else 0.0
+        return summary
+
+    def report(self):
+        total = sum(self._times.values())
+        print(' ')
+        print('{0:<12} {1:>10} {2:>8} {3:>12}'.format('Section', 'Seconds', 'Share', 'ms/step'))
+        for section in SECTIONS:
+            seconds = self._times[section]
+            print('{0:<12} {1:>10.3f} {2:>7.1f}% {3:>12.3f}'.format(
+                section,
+                seconds,
+                100 * seconds / total if total > 0 else 0.0,
+                1000 * seconds / self._steps if self._steps else 0.0,
+            ))
+        print('{0} steps, {1:.0f} examples/second'.format(self._steps, self.get_summary()['examples_per_second']))
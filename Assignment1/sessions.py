@@ -1,3 +1,4 @@
+import glob
 import os
 
 import tensorflow as tf
@@ -7,6 +8,7 @@ class Session:
     def __init__(self, directory='probedir', use_tensorboard=True):
         self._directory = directory
         self._use_tensorboard = use_tensorboard
+        self._saver = None
         self._session = tf.Session()
         if use_tensorboard:
             self._clear_tensorboard()
@@ -19,18 +21,37 @@ class Session:
             self._session.viewdir = self._directory
         self._session.run(tf.global_variables_initializer())
 
-    def run(self, graph_elements, feeder=None):
-        return self._session.run(graph_elements, feed_dict=feeder)
+    def run(self, graph_elements, feeder=None, options=None, run_metadata=None):
+        return self._session.run(graph_elements, feed_dict=feeder, options=options, run_metadata=run_metadata)
+
+    def add_scalars(self, values, step):
+        # Written directly as a summary protobuf, so logging scalars adds no ops to the graph
+        if self._use_tensorboard:
+            summary = tf.Summary(value=[tf.Summary.Value(tag=tag, simple_value=value) for tag, value in values.items()])
+            self._session.probe_stream.add_summary(summary, global_step=step)
+
+    def save(self, directory, step):
+        if self._saver is None:
+            self._saver = tf.train.Saver(max_to_keep=3)
+        os.makedirs(directory, exist_ok=True)
+        return self._saver.save(self._session, os.path.join(directory, 'model'), global_step=step)
+
+    def restore(self, directory):
+        checkpoint = tf.train.latest_checkpoint(directory)
+        if checkpoint is None:
+            return None
+        if self._saver is None:
+            self._saver = tf.train.Saver(max_to_keep=3)
+        self._saver.restore(self._session, checkpoint)
+        return checkpoint
 
     def close(self):
         if self._use_tensorboard:
             self._session.probe_stream.close()
         self._session.close()
         if self._use_tensorboard:
-            self._fireup_tensorboard()
+            print('View the summaries with: tensorboard --logdir={}'.format(self._directory))
 
     def _clear_tensorboard(self):
-        os.system('rm ' + self._directory + '/events.out.*')
-
-    def _fireup_tensorboard(self):
-        os.system('tensorboard --logdir=' + self._directory)
+        for filename in glob.glob(os.path.join(self._directory, 'events.out.*')):
+            os.remove(filename)
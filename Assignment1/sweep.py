@@ -0,0 +1,163 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import queue
+import random
+import time
+from loader import load_settings_file
+
+
+def get_trials(search_space):
+    parameters = search_space['parameters']
+    keys = sorted(parameters.keys())
+    if search_space.get('mode', 'grid') == 'grid':
+        return [dict(zip(keys, values)) for values in itertools.product(*(parameters[key] for key in keys))]
+    elif search_space['mode'] == 'random':
+        generator = random.Random(search_space.get('seed'))
+        return [
+            {key: generator.choice(parameters[key]) for key in keys}
+            for _ in range(search_space.get('trials', 10))
+        ]
+    else:
+        raise ValueError('Invalid search mode: "{}"'.format(search_space['mode']))
+
+
+def get_settings_update(overrides):
+    # Dotted keys address nested settings, e.g. "output_layer.activation"
+    update = {}
+    for key, value in overrides.items():
+        current = update
+        parts = key.split('.')
+        for part in parts[:-1]:
+            current = current.setdefault(part, {})
+        current[parts[-1]] = value
+    return update
+
+
+def run_trial(arguments):
+    trial_number, settings_file, overrides = arguments
+    result = {'trial': trial_number}
+    result.update({key: json.dumps(value) for key, value in overrides.items()})
+
+    start_time = time.time()
+    try:
+        # Imported here, so every trial process creates its own graph and session
+        from net import Net
+        from utils import set_random_seed
+
+        settings = load_settings_file(settings_file)
+        settings.update(get_settings_update(overrides))
+        set_random_seed(seed=settings.seed)
+        net = Net(settings=settings)
+        net.train()
+        result.update(net.get_metrics())
+        net.finish()
+    except Exception as error:
+        result['error'] = repr(error)
+    result['seconds'] = time.time() - start_time
+    return result
+
+
+def run_trial_process(target, arguments, results):
+    results.put(target(arguments))
+
+
+def run_trials(arguments, processes, target=run_trial):
+    """Yields the result of target for every trial as the trials finish, at most processes at a time.
+
+    Every trial runs in its own spawned process, so trials never share TensorFlow state. Unlike
+    Pool workers the processes are not daemonic, so a trial can start the worker processes of
+    data-parallel training.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    pending = list(arguments)
+    running = {}
+    while pending or running:
+        while pending and len(running) < processes:
+            trial_arguments = pending.pop(0)
+            process = context.Process(target=run_trial_process, args=(target, trial_arguments, results))
+            process.start()
+            running[trial_arguments[0]] = process
+
+        try:
+            result = results.get(timeout=1.0)
+        except queue.Empty:
+            # A trial process that died without a result, e.g. killed for running out of memory
+            for trial_number, process in list(running.items()):
+                if not process.is_alive() and process.exitcode != 0:
+                    del running[trial_number]
+                    yield {
+                        'trial': trial_number,
+                        'seconds': 0.0,
+                        'error': 'Trial process exited with code {}'.format(process.exitcode),
+                    }
+            continue
+
+        process = running.pop(result['trial'], None)
+        if process is None:
+            continue
+        process.join()
+        yield result
+
+
+def print_data_plan(settings, processes):
+    # Imported here, like net in run_trial, so the sweep process itself stays light
+    from cases import get_data_source
+
+    source = get_data_source(settings.data_source)
+    memory_size = source.get_memory_size(settings.dtype)
+    if memory_size is None:
+        print('Data source {}: size unknown until loaded'.format(source.name))
+    else:
+        print('Data source {0}: {1} rows, {2} -> {3}, {4:.1f} MB per trial, {5:.1f} MB for {6} processes'.format(
+            source.name,
+            source.rows,
+            source.input_size,
+            source.output_size,
+            memory_size / 2 ** 20,
+            memory_size * processes / 2 ** 20,
+            processes,
+        ))
+
+
+def run_sweep(settings_file, search_space, processes, output_file):
+    trials = get_trials(search_space)
+    fieldnames = ['trial'] + sorted(search_space['parameters'].keys()) + [
+        'training_error', 'validation_error', 'training_accuracy', 'test_error', 'test_accuracy', 'seconds', 'error',
+    ]
+    print('Running {} trials on {} processes'.format(len(trials), processes))
+    print_data_plan(load_settings_file(settings_file), processes)
+
+    arguments = [(index + 1, settings_file, overrides) for index, overrides in enumerate(trials)]
+    with open(output_file, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        for result in run_trials(arguments, processes):
+            writer.writerow(result)
+            file.flush()
+            print('Trial {0:>3} finished in {1:.1f}s, validation error: {2}'.format(
+                result['trial'],
+                result['seconds'],
+                result.get('validation_error'),
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train nets for every point of a hyperparameter search space')
+    parser.add_argument('settings_file', help='Path to the base settings file for the network')
+    parser.add_argument('search_space_file', help='Path to the search space file')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help='Number of parallel trials')
+    parser.add_argument('--output', default='sweep_results.csv', help='Path to the results table')
+    args = parser.parse_args()
+
+    with open(args.search_space_file) as json_file:
+        search_space = json.load(json_file)
+
+    run_sweep(args.settings_file, search_space, args.processes, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import csv
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import sweep
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_daemon_child(arguments):
+    # Starts a daemonic child like DataParallelTrainer does for its workers
+    trial_number, _, _ = arguments
+    process = multiprocessing.get_context('spawn').Process(target=os.getpid, daemon=True)
+    process.start()
+    process.join()
+    return {'trial': trial_number, 'seconds': 0.0}
+
+
+def test_trials_can_start_daemonic_children():
+    arguments = [(1, None, {}), (2, None, {})]
+    results = list(sweep.run_trials(arguments, processes=2, target=start_daemon_child))
+    assert sorted(result['trial'] for result in results) == [1, 2]
+    assert not any('error' in result for result in results)
+
+
+def test_sweep_trial_with_data_parallel_workers(tmp_path, monkeypatch):
+    pytest.importorskip('tensorflow')
+    monkeypatch.chdir(DIRECTORY)
+    search_space = {'mode': 'grid', 'parameters': {'workers': [2], 'steps': [20]}}
+    output_file = str(tmp_path / 'results.csv')
+
+    sweep.run_sweep(os.path.join('settings', 'iris.json'), search_space, 1, output_file)
+
+    with open(output_file, newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == 1
+    result = rows[0]
+    assert json.loads(result['workers']) == 2
+    assert result['error'] == ''
+    assert result['validation_error'] != ''
@@ -1,17 +1,17 @@
 # The functions in this file are used to generate datasets for machine-learning problems.
 
-import tensorflow as tf
+# TensorFlow, matplotlib and scipy are imported inside the functions that use them, so the data set
+# generators can be used without paying their import time.
 import numpy as np
 import copy
 import math
 import os  # For starting up tensorboard from inside python
-import matplotlib.pyplot as PLT
-import scipy.cluster.hierarchy as SCH  # Needed for dendrograms
 import numpy.random as NPR
 
 # ****** SESSION HANDLING *******
 
 def gen_initialized_session(dir='probeview'):
+    import tensorflow as tf
     sess = tf.Session()
     sess.probe_stream = viewprep(sess,dir=dir)  # Create a probe stream and attach to the session
     sess.viewdir = dir  # add a second slot, viewdir, to the session
@@ -19,6 +19,7 @@ def gen_initialized_session(dir='probeview'):
     return sess
 
 def copy_session(sess1):
+    import tensorflow as tf
     sess2 = tf.Session()
     sess2.probe_stream = sess1.probe_stream
     sess2.probe_stream.reopen()
@@ -32,6 +33,7 @@ def close_session(sess, view=True):
 
 # Simple evaluator of a TF operator.
 def tfeval(operators):
+    import tensorflow as tf
     sess = tf.Session()
     sess.run(tf.global_variables_initializer())
     result = sess.run(operators) # result = a list of output values, one from each operator.
@@ -43,6 +45,7 @@ def tfeval(operators):
 # This creates the main data for tensorboard viewing: the graph and variable histories.
 
 def viewprep(session, dir='probeview',flush=120,queue=10):
+    import tensorflow as tf
     clear_tensorflow_log(dir)  # Without this, the directory fills up with unusable files
     return tf.summary.FileWriter(dir,session.graph,flush_secs=flush,max_queue=queue)
 
@@ -319,6 +322,77 @@ def segmented_vector_string(v,pre='** ',post=' **'):
     return ''.join(map(str, binit(v))) + pre + str(segment_count(v)) + post
 
 
+# ****** VECTORIZED CASE GENERATORS ******
+# Batched equivalents of the generators above.  Each one builds all "count" cases at once with numpy and returns
+# a feature array X with one case per row and a target array Y, instead of a list of [features, target] pairs.
+
+# One-hot rows for an array of integer labels.
+def one_hot_arrays(labels,size):
+    Y = np.zeros((len(labels),size),dtype=np.uint8)
+    Y[np.arange(len(labels)),labels] = 1
+    return Y
+
+# Like gen_dense_vector for every row: row i gets exactly round(densities[i]*size) randomly placed on-bits.
+def gen_dense_vectors(size,densities):
+    count = len(densities)
+    on_counts = np.round(np.asarray(densities)*size).astype(int)
+    order = NPR.random((count,size)).argsort(axis=1)  # A random permutation of the positions per row
+    X = np.zeros((count,size),dtype=np.uint8)
+    np.put_along_axis(X,order,(np.arange(size) < on_counts[:,None]).astype(np.uint8),axis=1)
+    return X
+
+def gen_random_density_arrays(count,size,density_range=(0,1)):
+    return gen_dense_vectors(size,NPR.uniform(*density_range,size=count))
+
+def gen_dense_autoencoder_arrays(count,size,dr=(0,1)):
+    X = gen_random_density_arrays(count,size,density_range=dr)
+    return X, X.copy()
+
+def gen_vector_count_arrays(count,size,drange=(0,1)):
+    X = gen_random_density_arrays(count,size,density_range=drange)
+    return X, one_hot_arrays(X.sum(axis=1),size+1)
+
+def gen_symmetric_arrays(vlen,count):
+    halflen = math.floor(vlen/2)
+    halves = gen_random_density_arrays(count,halflen)
+    middle = NPR.randint(0,2,size=(count,vlen % 2)).astype(np.uint8)
+    return np.concatenate([halves,middle,halves[:,::-1]],axis=1)
+
+def check_array_symmetry(X):
+    return (X == X[:,::-1]).all(axis=1)
+
+# Rejection sampling as in gen_anti_symvect_cases, but only the rows that came out symmetric are redrawn each round.
+def gen_anti_symmetric_arrays(vlen,count):
+    X = gen_random_density_arrays(count,vlen)
+    rejected = np.flatnonzero(check_array_symmetry(X))
+    while len(rejected) > 0:
+        X[rejected] = gen_random_density_arrays(len(rejected),vlen)
+        rejected = rejected[check_array_symmetry(X[rejected])]
+    return X
+
+# Like gen_symvect_dataset, with the label as a one-hot target: [1,0] = anti-symmetric, [0,1] = symmetric.
+def gen_symvect_dataset_arrays(vlen,count):
+    s1 = math.floor(count/2); s2 = count - s1
+    X = np.concatenate([gen_symmetric_arrays(vlen,s1),gen_anti_symmetric_arrays(vlen,s2)])
+    labels = np.concatenate([np.ones(s1,dtype=int),np.zeros(s2,dtype=int)])
+    permutation = NPR.permutation(count)
+    return X[permutation], one_hot_arrays(labels[permutation],2)
+
+# A vector of length vlen with k segments is given by 2k distinct boundaries among the vlen+1 positions between
+# (and around) its bits: each segment starts at an even boundary and ends before the next one.  Choosing the
+# boundaries at random draws uniformly among all vectors with k segments, and the bits follow from the parity of
+# the number of boundaries at or before each position.
+def gen_segmented_vector_arrays(vectorlen,count,minsegs,maxsegs,poptargs=True):
+    if vectorlen < 2*maxsegs - 1:
+        raise ValueError('A vector of length {} cannot hold {} segments'.format(vectorlen,maxsegs))
+    numsegs = NPR.randint(minsegs,maxsegs+1,size=count)
+    ranks = NPR.random((count,vectorlen+1)).argsort(axis=1).argsort(axis=1)
+    boundaries = ranks < 2*numsegs[:,None]
+    X = (np.cumsum(boundaries[:,:vectorlen],axis=1) % 2).astype(np.uint8)
+    Y = one_hot_arrays(numsegs-minsegs,maxsegs-minsegs+1) if poptargs else numsegs
+    return X, Y
+
+
 # ***** PRIMITIVE DATA VIEWING ******
 
 def show_results(grabbed_vals,grabbed_vars=None,dir='probeview'):
@@ -341,6 +415,7 @@ def pp_matrix(m,style='{:.3f}'):
 # *******  DATA PLOTTING ROUTINES *********
 
 def simple_plot(yvals,xvals=None,xtitle='X',ytitle='Y',title='Y = F(X)'):
+    import matplotlib.pyplot as PLT
     xvals = xvals if xvals is not None else list(range(len(yvals)))
     PLT.plot(xvals,yvals)
     PLT.xlabel(xtitle); PLT.ylabel(ytitle); PLT.title(title)
@@ -348,6 +423,7 @@ def simple_plot(yvals,xvals=None,xtitle='X',ytitle='Y',title='Y = F(X)'):
 
 # Each history is a list of pairs (timestamp, value).
 def plot_training_history(error_hist,validation_hist=[],xtitle="Epoch",ytitle="Error",title="History",fig=True):
+    import matplotlib.pyplot as PLT
     PLT.ion()
     if fig: PLT.figure()
     if len(error_hist) > 0:
@@ -360,6 +436,7 @@ def plot_training_history(error_hist,validation_hist=[],xtitle="Epoch",ytitle="E
 
 # alpha = transparency
 def simple_scatter_plot(points,alpha=0.5,radius=3):
+    import matplotlib.pyplot as PLT
     colors = ['red','green','blue','magenta','brown','yellow','orange','brown','purple','black']
     a = np.array(points).transpose()
     PLT.scatter(a[0],a[1],c=colors,alpha=alpha,s=np.pi*radius**2)
@@ -376,6 +453,7 @@ def simple_scatter_plot(points,alpha=0.5,radius=3):
 
 def hinton_plot(matrix, maxval=None, maxsize=1, fig=None,trans=True,scale=True, title='Hinton plot',
                 colors=['gray','red','blue','white']):
+    import matplotlib.pyplot as PLT
     hfig = fig if fig else PLT.figure()
     hfig.suptitle(title,fontsize=18)
     if trans: matrix = matrix.transpose()
@@ -407,6 +485,7 @@ def hinton_plot(matrix, maxval=None, maxsize=1, fig=None,trans=True,scale=True,
 
 def display_matrix(matrix,fig=None,trans=True,scale=True, title='Matrix',tform='{:.3f}',tsize=12,
                    cutoff=0.1,colors=['red','yellow','grey','blue']):
+    import matplotlib.pyplot as PLT
     hfig = fig if fig else PLT.figure()
     hfig.suptitle(title,fontsize=18)
     if trans: matrix = matrix.transpose()
@@ -461,6 +540,8 @@ def gen_dim_reduced_data(feature_array,target_size,eigen_values,eigen_vectors):
 # mode = single, average, complete, centroid, ward, median
 # metric = euclidean, cityblock (manhattan), hamming, cosine, correlation ... (see matplotlib distance.pdist for all 23)
 def dendrogram(features,labels,metric='euclidean',mode='average',ax=None,title='Dendrogram',orient='top',lrot=90.0):
+    import matplotlib.pyplot as PLT
+    import scipy.cluster.hierarchy as SCH  # Needed for dendrograms
     ax = ax if ax else PLT.gca()
     cluster_history = SCH.linkage(features,method=mode,metric=metric)
     SCH.dendrogram(cluster_history,labels=labels,orientation=orient,leaf_rotation=lrot)
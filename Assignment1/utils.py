@@ -1,15 +1,14 @@
 import numpy as np
 import random
-import tensorflow as tf
 
 
-def get_distribution(settings, size):
+def get_distribution(settings, size, dtype=np.float64):
     lower, upper = settings.range
     if settings.distribution == 'uniform':
-        return np.random.uniform(lower, upper, size)
+        return np.random.uniform(lower, upper, size).astype(dtype)
     elif settings.distribution == 'normal':
         mean = (upper + lower) / 2
-        return np.random.normal(mean, settings.standard_deviation, size)
+        return np.random.normal(mean, settings.standard_deviation, size).astype(dtype)
 
 
 def set_random_seed(seed):
@@ -18,5 +17,6 @@ def set_random_seed(seed):
     if seed:
         random.seed(seed)
         np.random.seed(seed)
+        import tensorflow as tf
         tf.set_random_seed(seed)
 
@@ -0,0 +1,86 @@
+from abc import ABC, abstractmethod
+import os
+import random
+import sys
+
+ASSIGNMENT1_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Assignment1')
+
+
+class Evaluator(ABC):
+    """Scores a batch of leaf states with one call.
+
+    evaluate() returns one (value, priors) pair per state, where value is the
+    probability that state.next_player wins and priors maps the legal actions
+    of the state to prior probabilities (or is None for uniform priors).
+    """
+
+    @abstractmethod
+    def evaluate(self, states):
+        pass
+
+
+class RolloutEvaluator(Evaluator):
+    def evaluate(self, states):
+        results = []
+        for state in states:
+            rollout_state = state.get_copy()
+            while not rollout_state.game_over:
+                action = random.choice(rollout_state.get_actions())
+                rollout_state.do_action(action)
+            value = 1.0 if rollout_state.winner == state.next_player else 0.0
+            results.append((value, None))
+        return results
+
+
+class NetEvaluator(Evaluator):
+    """Evaluator backed by trained nets.
+
+    The models are callables taking a list of feature vectors and returning one
+    output row per vector, i.e. a single forward pass for the whole batch. The
+    policy model outputs one value per board cell and the value model outputs
+    the win probabilities of player 1 and player 2. Leaves are scored with
+    random rollouts when no value model is given.
+    """
+
+    def __init__(self, policy_model=None, value_model=None):
+        self.policy_model = policy_model
+        self.value_model = value_model
+        self.rollout_evaluator = RolloutEvaluator()
+
+    def evaluate(self, states):
+        features = [state.get_features() for state in states]
+
+        if self.value_model:
+            value_rows = self.value_model(features)
+            values = [row[state.next_player - 1] for state, row in zip(states, value_rows)]
+        else:
+            values = [value for value, _ in self.rollout_evaluator.evaluate(states)]
+
+        if self.policy_model:
+            policy_rows = self.policy_model(features)
+            priors = [self.get_priors(state, row) for state, row in zip(states, policy_rows)]
+        else:
+            priors = [None] * len(states)
+
+        return list(zip(values, priors))
+
+    @staticmethod
+    def from_files(policy_file=None, value_file=None):
+        """Creates an evaluator from nets exported with Net.export in Assignment1"""
+        if ASSIGNMENT1_DIRECTORY not in sys.path:
+            sys.path.append(ASSIGNMENT1_DIRECTORY)
+        from predictor import Predictor
+
+        return NetEvaluator(
+            policy_model=Predictor.load(policy_file) if policy_file else None,
+            value_model=Predictor.load(value_file) if value_file else None,
+        )
+
+    @staticmethod
+    def get_priors(state, row):
+        actions = state.get_actions()
+        weights = [max(float(row[i * state.size + j]), 0.0) for i, j in actions]
+        total = sum(weights)
+        if total <= 0:
+            return None
+        return {action: weight / total for action, weight in zip(actions, weights)}
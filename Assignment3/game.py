@@ -10,11 +10,14 @@ from policy import Policy
 import queue
 from threading import Thread
 from app import Application
+from replay import ReplayBuffer
+from evaluator import NetEvaluator
 
 
 class Game:
-    def __init__(self, game_settings=None):
+    def __init__(self, game_settings=None, evaluator=None):
         self.game_settings = game_settings
+        self.evaluator = evaluator
 
         self.state = None
         self.node_managers = {}
@@ -23,13 +26,22 @@ class Game:
         self.score_policy = None
         self.stats = {}
         self.app = None
+        self.replay_buffer = None
 
         self.init_policies()
+        self.init_evaluator()
+        self.init_replay_buffer()
         self.setup()
 
     def setup(self):
-        self.node_managers[1] = NodeManager()
-        self.node_managers[2] = NodeManager()
+        for player in (1, 2):
+            if player in self.node_managers:
+                self.node_managers[player].reset()
+            else:
+                self.node_managers[player] = NodeManager(
+                    widening_constant=self.game_settings.get('widening_constant'),
+                    widening_exponent=self.game_settings.get('widening_exponent', 0.5),
+                )
         if self.game_settings['game'] == 'hex':
             self.setup_hex()
         if self.app:
@@ -39,6 +51,8 @@ class Game:
     def start(self):
         for i in range(1, self.game_settings.get('G', 10) + 1):
             self.play(i)
+        if self.replay_buffer:
+            self.replay_buffer.flush()
 
     def setup_hex(self):
         if self.game_settings['P'] == 'random':
@@ -54,6 +68,25 @@ class Game:
         self.tree_policy = Policy.Tree.get(self.game_settings.get('tree_policy'))
         self.score_policy = Policy.Score.get(self.game_settings.get('score_policy'))
 
+    def init_evaluator(self):
+        policy_model = self.game_settings.get('policy_model')
+        value_model = self.game_settings.get('value_model')
+        if self.evaluator is None and (policy_model or value_model):
+            self.evaluator = NetEvaluator.from_files(policy_file=policy_model, value_file=value_model)
+
+    def init_replay_buffer(self):
+        directory = self.game_settings.get('replay_directory')
+        if directory:
+            self.replay_buffer = ReplayBuffer(directory, shard_size=self.game_settings.get('shard_size', 1000))
+
+    def get_visit_distribution(self, node):
+        distribution = [0.0] * (self.state.size ** 2)
+        total_traversals = sum(child.traversals for child in node.children.values())
+        if total_traversals:
+            for (i, j), child in node.children.items():
+                distribution[i * self.state.size + j] = child.traversals / total_traversals
+        return distribution
+
     def display_stats(self):
         total_games = self.game_settings.get('G')
         for key in self.stats.keys():
@@ -67,10 +100,14 @@ class Game:
             print(f'GAME NUMBER {number}:')
 
             print(f'Start state: {self.state}')
+        positions = []
         while not self.state.game_over:
             next_player = self.state.next_player
             node_manager = self.node_managers.get(next_player)
             best_action = self.simulate_best_action(self.state)
+            if self.replay_buffer:
+                root_node = node_manager.get_node(self.state)
+                positions.append((self.state.get_features(), self.get_visit_distribution(root_node)))
             self.state.do_action(best_action)
             self.app.update(self.state)
             if verbose:
@@ -81,6 +118,8 @@ class Game:
         winner = self.state.winner
         print(f'Player {winner} won game {number}!\n')
         self.stats[winner] = self.stats.get(winner, 0) + 1
+        if self.replay_buffer:
+            self.replay_buffer.add_game(positions, winner)
 
         self.setup()
 
@@ -91,7 +130,10 @@ class Game:
             node_manager=node_manager,
             tree_policy=self.tree_policy,
             score_policy=self.score_policy,
-            iterations=self.game_settings.get('M')
+            iterations=self.game_settings.get('M'),
+            evaluator=self.evaluator,
+            batch_size=self.game_settings.get('batch_size', 1),
+            disable_gc=self.game_settings.get('disable_gc', False),
         )
         simulation.run()
         root_node = node_manager.get_node(self.state)
@@ -1,8 +1,18 @@
 class Node:
+    __slots__ = ('state', 'parent', 'children', 'priors', 'unexpanded_actions', 'score', 'traversals')
+
     def __init__(self, state, parent=None):
+        self.children = {}
+        self.priors = {}
+        self.unexpanded_actions = []
+        self.reset(state, parent)
+
+    def reset(self, state, parent=None):
         self.state = state
         self.parent = parent
-        self.children = {}
+        self.children.clear()
+        self.priors.clear()
+        self.unexpanded_actions.clear()
         self.score = 0
         self.traversals = 0
 
@@ -1,30 +1,72 @@
+import math
+
 from node import Node
 
 class NodeManager:
-    def __init__(self):
+    def __init__(self, widening_constant=None, widening_exponent=0.5):
         self.nodes = {}
+        self.free_nodes = []
+        self.widening_constant = widening_constant
+        self.widening_exponent = widening_exponent
+
+    def create_node(self, state):
+        if self.free_nodes:
+            new_node = self.free_nodes.pop()
+            new_node.reset(state)
+            return new_node
+        else:
+            return Node(state=state)
+
+    def reset(self):
+        """Releases all nodes to the pool so the next search can reuse them"""
+        for node in self.nodes.values():
+            node.reset(None)
+        self.free_nodes.extend(self.nodes.values())
+        self.nodes.clear()
 
     def get_node(self, state):
         key = repr(state)
         if key in self.nodes:
             return self.nodes.get(key)
         else:
-            new_node = Node(state=state)
+            new_node = self.create_node(state)
             self.nodes[key] = new_node
             return new_node
 
     def expand_node(self, node):
-        for action in node.state.get_actions():
-            new_state = node.state.get_copy()
-            new_state.do_action(action)
-            key = repr(new_state)
-            if key in self.nodes:
-                new_node = self.nodes.get(key)
-            else:
-                new_node = Node(state=new_state)
-                self.nodes[key] = new_node
-            
-            node.children[action] = new_node
+        if self.widening_constant:
+            # Keep the best actions last, so the next one to add is popped from the end
+            node.unexpanded_actions = list(reversed(self.get_ordered_actions(node)))
+            self.widen_node(node)
+        else:
+            for action in node.state.get_actions():
+                self.add_child(node, action)
+
+    def widen_node(self, node):
+        """Progressive widening, exposes more children as the node gets more traversals"""
+        if not node.unexpanded_actions:
+            return
+        allowed_children = math.ceil(self.widening_constant * (node.traversals + 1) ** self.widening_exponent)
+        while node.unexpanded_actions and len(node.children) < allowed_children:
+            self.add_child(node, node.unexpanded_actions.pop())
+
+    def get_ordered_actions(self, node):
+        if node.priors:
+            return sorted(node.state.get_actions(), key=lambda action: node.priors.get(action, 0), reverse=True)
+        else:
+            return node.state.get_ordered_actions()
+
+    def add_child(self, node, action):
+        new_state = node.state.get_copy()
+        new_state.do_action(action)
+        key = repr(new_state)
+        if key in self.nodes:
+            new_node = self.nodes.get(key)
+        else:
+            new_node = self.create_node(new_state)
+            self.nodes[key] = new_node
+        
+        node.children[action] = new_node
 
 
 
@@ -9,6 +9,8 @@ class Policy:
                 return Policy.Tree.utc_wiki
             elif name == 'utc_lecture':
                 return Policy.Tree.utc_lecture
+            elif name == 'puct':
+                return Policy.Tree.puct
             else:
                 raise ValueError(f'Invalid tree policy: "{name}"')
 
@@ -63,6 +65,29 @@ class Policy:
 
             return best_action
 
+        @staticmethod
+        def puct(node):
+            """PUCT Algorithm, exploration weighted by the priors of the node"""
+            c = 1
+            if not node.has_children:
+                return None
+
+            default_prior = 1 / len(node.children)
+            exploration = c * math.sqrt(node.traversals)
+
+            best_action = None
+            best_score = - math.inf
+            for action in node.children.keys():
+                child = node.children[action]
+                prior = node.priors.get(action, default_prior)
+                child_score = child.get_probability() + exploration * prior / (child.traversals + 1)
+
+                if child_score > best_score:
+                    best_score = child_score
+                    best_action = action
+
+            return best_action
+
         @staticmethod
         def best(node):
             """"Returns the best action (explotation)"""
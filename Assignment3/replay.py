@@ -0,0 +1,75 @@
+import os
+import re
+import tempfile
+
+import numpy as np
+
+
+class ReplayBuffer:
+    """Append-only store of self-play positions, written as compressed NumPy shards.
+
+    Every shard holds the arrays 'features' (Hex.get_features of each position),
+    'distributions' (root visit distribution over the board cells) and 'winners'
+    (winner of the game the position was played in). Existing shards are never
+    rewritten, new positions go to new shard files, also when several buffers
+    write to the same directory.
+    """
+
+    def __init__(self, directory, shard_size=1000):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.features = []
+        self.distributions = []
+        self.winners = []
+        os.makedirs(self.directory, exist_ok=True)
+        self.next_shard = self.get_next_shard_number()
+
+    def get_next_shard_number(self):
+        next_shard = 0
+        for filename in os.listdir(self.directory):
+            match = re.match(r'shard-(\d+)\.npz$', filename)
+            if match:
+                next_shard = max(next_shard, int(match.group(1)) + 1)
+        return next_shard
+
+    def claim_shard(self, temporary_filename):
+        # Linking fails if the name exists, so a shard written by another buffer is never replaced
+        while True:
+            filename = os.path.join(self.directory, f'shard-{self.next_shard:05d}.npz')
+            self.next_shard += 1
+            try:
+                os.link(temporary_filename, filename)
+                return filename
+            except FileExistsError:
+                pass
+
+    def add_game(self, positions, winner):
+        for features, distribution in positions:
+            self.features.append(features)
+            self.distributions.append(distribution)
+            self.winners.append(winner)
+
+        if len(self.features) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self.features:
+            return
+
+        # The temporary name is unique and does not match the shard pattern, so readers never see a partial shard
+        file_descriptor, temporary_filename = tempfile.mkstemp(dir=self.directory, prefix='.shard-', suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as file:
+                np.savez_compressed(
+                    file,
+                    features=np.array(self.features, dtype=np.uint8),
+                    distributions=np.array(self.distributions, dtype=np.float32),
+                    winners=np.array(self.winners, dtype=np.uint8),
+                )
+            self.claim_shard(temporary_filename)
+        finally:
+            os.remove(temporary_filename)
+
+        self.features = []
+        self.distributions = []
+        self.winners = []
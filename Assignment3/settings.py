@@ -10,4 +10,12 @@ class Settings:
             'verbose': True,
             'tree_policy': 'utc_wiki',
             'score_policy': 'zero_one',
+            'batch_size': 8,
+            'policy_model': None,
+            'value_model': None,
+            'disable_gc': True,
+            'widening_constant': None,
+            'widening_exponent': 0.5,
+            'replay_directory': None,
+            'shard_size': 1000,
         }
@@ -1,28 +1,57 @@
+import gc
 import random
 
 
 class Simulation:
-    def __init__(self, start_state, node_manager, tree_policy, score_policy, iterations=1000):
+    def __init__(self, start_state, node_manager, tree_policy, score_policy, iterations=1000, evaluator=None,
+                 batch_size=1, disable_gc=False):
         self.start_state = start_state
         self.node_manager = node_manager
         self.tree_policy = tree_policy
         self.score_policy = score_policy
         self.iterations = iterations
+        self.evaluator = evaluator
+        self.batch_size = batch_size
+        self.disable_gc = disable_gc
         self.visited = []
 
     def run(self):
-        for i in range(1, self.iterations + 1):
-            self.search()
+        # The search only allocates acyclic nodes and states, so the cyclic garbage collector
+        # has nothing to free and its pauses can be skipped until the search is done
+        gc_enabled = gc.isenabled()
+        if self.disable_gc:
+            gc.disable()
+        try:
+            self.search_all()
+        finally:
+            if gc_enabled:
+                gc.enable()
 
-    def search(self):
+    def search_all(self):
+        if self.evaluator:
+            remaining = self.iterations
+            while remaining > 0:
+                batch_size = min(self.batch_size, remaining)
+                self.search_batch(batch_size)
+                remaining -= batch_size
+        else:
+            for i in range(1, self.iterations + 1):
+                self.search()
+
+    def select(self):
         self.visited = []
         current_node = self.node_manager.get_node(self.start_state)
         self.visited.append(current_node)
         while current_node.has_children:
+            self.node_manager.widen_node(current_node)
             action = self.tree_policy(current_node)
             next_node = current_node.children[action]
             self.visited.append(next_node)
             current_node = next_node
+        return current_node
+
+    def search(self):
+        current_node = self.select()
 
         if current_node.state.game_over:
             self.backprop(current_node.state.winner)
@@ -33,6 +62,39 @@ class Simulation:
             self.visited.append(next_node)
             self.rollout(next_node)
 
+    def search_batch(self, batch_size):
+        """Selects up to batch_size leaves and scores them with one evaluator call"""
+        pending = []
+        for _ in range(batch_size):
+            leaf = self.select()
+            if leaf.state.game_over:
+                self.backprop(leaf.state.winner)
+                continue
+
+            # Virtual loss, makes the following selections in this batch prefer other paths
+            for node in self.visited:
+                node.traversals += 1
+            pending.append((leaf, self.visited))
+
+        if not pending:
+            return
+
+        leaves = list({id(leaf): leaf for leaf, _ in pending}.values())
+        results = self.evaluator.evaluate([leaf.state for leaf in leaves])
+        values = {}
+        for leaf, (value, priors) in zip(leaves, results):
+            values[id(leaf)] = value
+            if not leaf.has_children:
+                if priors:
+                    leaf.priors = priors
+                self.node_manager.expand_node(leaf)
+
+        for leaf, visited in pending:
+            for node in visited:
+                node.traversals -= 1
+            self.visited = visited
+            self.backprop_value(leaf.state.next_player, values[id(leaf)])
+
     def rollout(self, current_node):
         state = current_node.state.get_copy()
         while not state.game_over:
@@ -47,5 +109,14 @@ class Simulation:
             did_player_win = winner != current_node.state.next_player
             current_node.update(delta_score=self.score_policy(win=did_player_win))
 
-
-
+    def backprop_value(self, player, value):
+        """Backpropagates the probability value that player wins"""
+        win_score = self.score_policy(win=True)
+        loss_score = self.score_policy(win=False)
+        while self.visited:
+            current_node = self.visited.pop()
+            if current_node.state.next_player == player:
+                win_probability = 1 - value
+            else:
+                win_probability = value
+            current_node.update(delta_score=win_probability * win_score + (1 - win_probability) * loss_score)
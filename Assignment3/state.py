@@ -21,6 +21,17 @@ class Hex:
                     actions.append((i, j))
         return actions
     
+    def get_ordered_actions(self):
+        """Returns the actions sorted by their hex distance to the center of the board"""
+        center = (self.size - 1) / 2
+
+        def distance_to_center(action):
+            dx = action[0] - center
+            dy = action[1] - center
+            return (abs(dx) + abs(dy) + abs(dx + dy)) / 2
+
+        return sorted(self.get_actions(), key=distance_to_center)
+
     def do_action(self, action):
         x, y = action
         self.board[x][y] = self.next_player
@@ -34,6 +45,16 @@ class Hex:
         new_board = [[x for x in row] for row in self.board]
         return Hex(board=new_board, turn=self.turn, next_player=self.next_player)
     
+    def get_features(self):
+        features = []
+        for row in self.board:
+            for cell in row:
+                features.append(1 if cell == 1 else 0)
+                features.append(1 if cell == 2 else 0)
+        features.append(1 if self.next_player == 1 else 0)
+        features.append(1 if self.next_player == 2 else 0)
+        return features
+
     def __repr__(self):
         s = ''
         for row in self.board: